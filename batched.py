@@ -0,0 +1,121 @@
+""" Batched NumPy evaluation of many Teeko2 positions at once.
+
+A batch of (black, red) bitboard pairs is unpacked into an (n, 2, 25) array of
+0/1 squares. Multiplying it by a precomputed square-by-line matrix gives every
+color's marker count on every heuristic line, diamond ring and winning line in
+one step, from which wins and the longest-line heuristic of the whole batch are
+read off with array operations. The results are identical to bitboard.winner(),
+bitboard.heuristic() and Teeko2Player.game_value().
+
+NumPy is optional: the module imports without it, and the functions raise
+ImportError when called.
+"""
+import bitboard
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_CELLS = bitboard.SIZE * bitboard.SIZE
+
+
+def available():
+    """ True if NumPy is installed """
+    return np is not None
+
+
+def _require():
+    if np is None:
+        raise ImportError("batched evaluation needs numpy (pip install numpy)")
+
+
+# columns of LINE_MATRIX: heuristic lines, then diamond rings, then winning lines
+_RINGS = [ring for (ring, center) in bitboard.DIAMONDS]
+_LINES = list(bitboard.HEURISTIC_LINES) + _RINGS + list(bitboard.WIN_LINES)
+_RING_FIRST = len(bitboard.HEURISTIC_LINES)
+_WIN_FIRST = _RING_FIRST + len(_RINGS)
+
+if np is not None:
+    # (lines, 25) 0/1 matrix, 1 where a square lies on a line. float32 so the
+    # product goes through BLAS; the counts (at most 5) are exact.
+    LINE_MATRIX = np.array([[m >> i & 1 for i in range(_CELLS)] for m in _LINES],
+                           dtype=np.float32)
+    CENTER_INDEX = np.array([center.bit_length() - 1 for (ring, center) in bitboard.DIAMONDS])
+
+
+def encode(positions):
+    """ Unpacks a sequence of (black, red) bitboard pairs into an (n, 2, 25)
+    float32 array of 0/1 squares.
+    """
+    _require()
+    packed = np.array(positions, dtype='<u4').reshape(-1, 2)
+    squares = np.unpackbits(packed.view(np.uint8).reshape(-1, 2, 4), axis=2, bitorder='little')
+    return squares[:, :, :_CELLS].astype(np.float32)
+
+
+def line_maxima(squares):
+    """ Longest lines of both colors in an encoded batch.
+
+    Returns:
+        tuple: (straight, diamond, win) arrays of shape (n, 2) holding each
+            color's most markers on one HEURISTIC_LINES mask, on one DIAMONDS ring
+            with an empty center (0 if there is none) and on one WIN_LINES mask
+    """
+    n = len(squares)
+    # one column per (position, color), so the maxima reduce over contiguous rows
+    counts = LINE_MATRIX @ squares.reshape(2 * n, _CELLS).T
+    occupied = squares[:, 0, CENTER_INDEX] + squares[:, 1, CENTER_INDEX]
+    empty_centers = np.repeat(occupied.T == 0, 2, axis=1)
+    rings = counts[_RING_FIRST:_WIN_FIRST] * empty_centers
+    return (counts[:_RING_FIRST].max(axis=0).reshape(n, 2), rings.max(axis=0).reshape(n, 2),
+            counts[_WIN_FIRST:].max(axis=0).reshape(n, 2))
+
+
+def _has_won(diamond, win):
+    """ (n, 2) bool array of bitboard.has_won() for both colors """
+    return (win == 4) | (diamond == 4)
+
+
+def _longest(straight, diamond):
+    """ (n, 2) int array of bitboard.longest_line() for both colors """
+    return np.maximum(straight, diamond).astype(np.int64)
+
+
+def winners(positions):
+    """ Array of bitboard.winner() values, -1 standing for None """
+    _require()
+    (straight, diamond, win) = line_maxima(encode(positions))
+    won = _has_won(diamond, win)
+    return np.where(won[:, 0], 0, np.where(won[:, 1], 1, -1))
+
+
+def heuristics(positions, me):
+    """ Array of bitboard.heuristic(bits[me], bits[1 - me]) for every position """
+    _require()
+    (straight, diamond, win) = line_maxima(encode(positions))
+    return _heuristic(_longest(straight, diamond), me)
+
+
+def _heuristic(longest, me):
+    mymax = longest[:, me]
+    oppmax = longest[:, 1 - me]
+    return np.where(mymax == oppmax, 0.0,
+                    np.where(mymax > oppmax, mymax / 6.0, -oppmax / 6.0))
+
+
+def leaf_values(positions, me, linear=None):
+    """ Scores positions for color index me the way Teeko2Player.max_value
+    scores a depth 0 node: 1 or -1 for a won or lost position, otherwise the
+    heuristic, or linear.scores() if a linear_eval.LinearEvaluator is given.
+    """
+    _require()
+    if len(positions) == 0:
+        return np.zeros(0)
+    (straight, diamond, win) = line_maxima(encode(positions))
+    won = _has_won(diamond, win)
+    black = 1.0 if me == 0 else -1.0
+    value = np.where(won[:, 0], black, np.where(won[:, 1], -black, 0.0))
+    if linear is not None:
+        return np.where(won.any(axis=1), value, linear.scores(positions, me))
+    return np.where(won.any(axis=1), value, _heuristic(_longest(straight, diamond), me))
@@ -0,0 +1,397 @@
+""" Micro-benchmarks for the Teeko2Player hot paths.
+
+Each benchmark runs over the same seeded set of drop and move phase positions
+and reports operations per second, so results from two revisions of the code
+can be compared directly to catch regressions in succ, max_value, alpha_beta
+and the evaluators.
+
+memory() compares the peak memory traced while searching the same positions
+to the same depth with successors copied as list boards (as succ once did),
+collected into succ() lists, streamed by bitboard.iter_children (max_value)
+and made and taken back in place by IncrementalBoard.successors.
+
+Usage:
+    python benchmark.py [--positions 200] [--seed 0] [--json bench.json] [name ...]
+    python benchmark.py --memory [--depth 2] [--positions 20]
+"""
+import argparse
+import copy
+import json
+import random
+import time
+import tracemalloc
+
+import batched
+import bitboard
+import eval_cache
+import evaluator
+import game
+import linear_eval
+import mcts
+import threats
+
+
+def sample_positions(count, seed=0):
+    """ Returns `count` undecided positions with the side to move, half from
+    the drop phase and half from the move phase, reached by seeded random play.
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        bits = (0, 0)
+        plies = rng.randint(1, 7) if len(positions) % 2 == 0 else rng.randint(8, 30)
+        for ply in range(plies):
+            turn = ply % 2
+            moves = list(bitboard.iter_moves(bits[turn], bits[1 - turn]))
+            child = bitboard.apply_move(bits, turn, *rng.choice(moves))
+            if bitboard.winner(child) is not None:
+                break
+            bits = child
+        else:
+            positions.append((bits, plies % 2))
+    return positions
+
+
+def _player(turn):
+    player = game.Teeko2Player()
+    player.my_piece = player.pieces[turn]
+    player.book = None
+    player.tablebase = None
+    return player
+
+
+def bench_succ(positions):
+    player = _player(0)
+    for (bits, turn) in positions:
+        player.succ(bits, turn)
+    return len(positions)
+
+
+def bench_legal_moves(positions):
+    n = 0
+    for (bits, turn) in positions:
+        for move in bitboard.iter_moves(bits[turn], bits[1 - turn]):
+            n += 1
+    return n
+
+
+def bench_game_value(positions):
+    player = _player(0)
+    for (bits, turn) in positions:
+        player.game_value(bits)
+    return len(positions)
+
+
+def bench_heuristic(positions):
+    player = _player(0)
+    for (bits, turn) in positions:
+        player.heuristic_game_value(bits, player.pieces[turn])
+    return len(positions)
+
+
+def bench_forced_move(positions):
+    """ positions per second checked for wins, forced blocks and double threats """
+    for (bits, turn) in positions:
+        threats.forced_move(bits, turn)
+    return len(positions)
+
+
+def bench_linear_eval(positions):
+    """ positions per second scored by a linear_eval.LinearEvaluator """
+    linear = linear_eval.LinearEvaluator(weights=[1.0] * len(linear_eval.FEATURES))
+    for (bits, turn) in positions:
+        linear.score(bits, turn)
+    return len(positions)
+
+
+def bench_incremental(positions):
+    """ make + heuristic + unmake for every legal move """
+    n = 0
+    for (bits, turn) in positions:
+        board = evaluator.IncrementalBoard(bits)
+        for move in bitboard.iter_moves(bits[turn], bits[1 - turn]):
+            board.make(turn, *move)
+            board.heuristic(turn)
+            board.unmake(turn, *move)
+            n += 1
+    return n
+
+
+_frontiers = {}
+
+
+def _frontier(positions):
+    """ Every child of the sample positions, as a search frontier would hold """
+    key = tuple(positions)
+    if key not in _frontiers:
+        _frontiers[key] = [bitboard.apply_move(bits, turn, *move) for (bits, turn) in positions
+                           for move in bitboard.iter_moves(bits[turn], bits[1 - turn])]
+    return _frontiers[key]
+
+
+def bench_scalar_leaves(positions):
+    """ frontier positions per second scored like a max_value leaf, one at a time """
+    player = _player(0)
+    leaves = _frontier(positions)
+    for bits in leaves:
+        player.game_value(bits) or player.heuristic_game_value(bits, player.my_piece)
+    return len(leaves)
+
+
+def _linear_leaves(positions, cache):
+    player = _player(0)
+    player.linear = linear_eval.LinearEvaluator(weights=[1.0] * len(linear_eval.FEATURES))
+    if cache:
+        player.eval_cache = eval_cache.EvalCache()
+    leaves = _frontier(positions)
+    # twice, as consecutive searches meet the same positions again
+    for k in range(2):
+        for bits in leaves:
+            player.game_value(bits) or player.heuristic_game_value(bits, player.my_piece)
+    return 2 * len(leaves)
+
+
+def bench_linear_leaves(positions):
+    """ the same frontier scored twice with a linear_eval.LinearEvaluator """
+    return _linear_leaves(positions, False)
+
+
+def bench_cached_leaves(positions):
+    """ the same, with the scores kept in an eval_cache.EvalCache """
+    return _linear_leaves(positions, True)
+
+
+def bench_batched_leaves(positions):
+    """ the same frontier scored with batched.leaf_values """
+    leaves = _frontier(positions)
+    for start in range(0, len(leaves), game.BATCH_SIZE):
+        batched.leaf_values(leaves[start:start + game.BATCH_SIZE], 0)
+    return len(leaves)
+
+
+def bench_max_value(positions):
+    """ nodes per second of the plain minimax search at depth 1 """
+    nodes = 0
+    for (bits, turn) in positions[:40]:
+        player = _player(turn)
+        player.search_root(bits, turn, 1, 'minimax')
+        nodes += player.stats['nodes']
+    return nodes
+
+
+def bench_batched_search(positions):
+    """ nodes per second of the minimax search at depth 1 with batched leaves """
+    nodes = 0
+    for (bits, turn) in positions[:40]:
+        player = _player(turn)
+        player.search_root(bits, turn, 1, 'batched')
+        nodes += player.stats['nodes']
+    return nodes
+
+
+def bench_mcts(positions):
+    """ playouts per second of the MCTS engine, 200 per position """
+    playouts = 0
+    for (bits, turn) in positions[:20]:
+        engine = mcts.MCTS(iterations=200, seed=0)
+        engine.search(bits, turn)
+        playouts += engine.stats['playouts']
+    return playouts
+
+
+def bench_alpha_beta(positions):
+    """ nodes per second of the alpha-beta search at depth 2 """
+    nodes = 0
+    for (bits, turn) in positions[:40]:
+        player = _player(turn)
+        player.search_root(bits, turn, 2, 'alphabeta')
+        nodes += player.stats['nodes']
+    return nodes
+
+
+BENCHMARKS = {
+    'succ': bench_succ,
+    'legal_moves': bench_legal_moves,
+    'game_value': bench_game_value,
+    'heuristic': bench_heuristic,
+    'linear_eval': bench_linear_eval,
+    'incremental': bench_incremental,
+    'forced_move': bench_forced_move,
+    'scalar_leaves': bench_scalar_leaves,
+    'linear_leaves': bench_linear_leaves,
+    'cached_leaves': bench_cached_leaves,
+    'max_value': bench_max_value,
+    'alpha_beta': bench_alpha_beta,
+    'mcts': bench_mcts,
+}
+if batched.available():
+    BENCHMARKS['batched_leaves'] = bench_batched_leaves
+    BENCHMARKS['batched_search'] = bench_batched_search
+
+
+def _deepcopy_succ(state, piece):
+    """ Children of a list-of-lists board, each a deep copy, as succ() used to
+    build them
+    """
+    children = []
+    drop = sum(row.count(piece) for row in state) < 4
+    for row in range(5):
+        for col in range(5):
+            if drop and state[row][col] == ' ':
+                child = copy.deepcopy(state)
+                child[row][col] = piece
+                children.append([child, (row, col), 0])
+            elif not drop and state[row][col] == piece:
+                for i in bitboard.NEIGHBORS[row * 5 + col]:
+                    (r, c) = bitboard.SQUARES[i]
+                    if state[r][c] == ' ':
+                        child = copy.deepcopy(state)
+                        child[row][col] = ' '
+                        child[r][c] = piece
+                        children.append([child, (r, c), (row, col)])
+    return children
+
+
+def _minimax_deepcopy(player, state, depth, turn, nodes):
+    nodes[0] += 1
+    s = player.game_value(state)
+    if s != 0:
+        return s
+    if depth == 0:
+        return player.heuristic_game_value(state, player.my_piece)
+    scores = [_minimax_deepcopy(player, child[0], depth - 1, 1 - turn, nodes)
+              for child in _deepcopy_succ(state, player.pieces[turn])]
+    if not scores:
+        return float('-inf') if player.pieces[turn] == player.my_piece else float('inf')
+    return max(scores) if player.pieces[turn] == player.my_piece else min(scores)
+
+
+def _minimax_succ(player, bits, depth, turn, nodes):
+    nodes[0] += 1
+    s = player.game_value(bits)
+    if s != 0:
+        return s
+    if depth == 0:
+        return player.heuristic_game_value(bits, player.my_piece)
+    scores = [_minimax_succ(player, child[0], depth - 1, 1 - turn, nodes)
+              for child in player.succ(bits, turn)]
+    if not scores:
+        return float('-inf') if player.pieces[turn] == player.my_piece else float('inf')
+    return max(scores) if player.pieces[turn] == player.my_piece else min(scores)
+
+
+def _minimax_in_place(board, depth, turn, me, nodes):
+    nodes[0] += 1
+    w = board.winner()
+    if w is not None:
+        return 1 if w == me else -1
+    if depth == 0:
+        return board.heuristic(me)
+    value = float('-inf') if turn == me else float('inf')
+    for move in board.successors(turn):
+        score = _minimax_in_place(board, depth - 1, 1 - turn, me, nodes)
+        value = max(value, score) if turn == me else min(value, score)
+    return value
+
+
+def memory(count=20, seed=0, depth=2):
+    """ Searches the sample positions depth plies deep along each successor
+    path and measures them with tracemalloc.
+
+    Returns:
+        dict: path -> {'nodes': int, 'peak_bytes': int, 'bytes_per_node': float,
+            'seconds': float}
+    """
+    positions = sample_positions(count, seed)
+    # players are made up front: each allocates a transposition table
+    players = [_player(0), _player(1)]
+
+    def search(path):
+        nodes = [0]
+        scores = []
+        for (bits, turn) in positions:
+            player = players[turn]
+            player.stats = {'nodes': 0}
+            if path == 'deepcopy':
+                score = _minimax_deepcopy(player, bitboard.to_state(bits), depth, turn, nodes)
+            elif path == 'succ_list':
+                score = _minimax_succ(player, bits, depth, turn, nodes)
+            elif path == 'generator':
+                score = player.max_value(bits, depth, turn)
+                nodes[0] += player.stats['nodes']
+            else:
+                score = _minimax_in_place(evaluator.IncrementalBoard(bits), depth, turn, turn,
+                                          nodes)
+            scores.append(score)
+        return (nodes[0], scores)
+
+    results = {}
+    expected = None
+    for path in ('deepcopy', 'succ_list', 'generator', 'in_place'):
+        search(path) # warm the evaluation caches so they do not count
+        tracemalloc.start()
+        start = time.perf_counter()
+        (nodes, scores) = search(path)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if expected is None:
+            expected = scores
+        elif scores != expected:
+            raise AssertionError(path + " search disagrees with deepcopy search")
+        results[path] = {'nodes': nodes, 'peak_bytes': peak, 'bytes_per_node': peak / nodes,
+                         'seconds': seconds}
+    return results
+
+
+def run(names=None, count=200, seed=0, repeat=3):
+    """ Runs the named benchmarks (all by default), keeping the fastest of
+    `repeat` runs of each.
+
+    Returns:
+        dict: name -> {'ops': int, 'seconds': float, 'ops_per_sec': float}
+    """
+    positions = sample_positions(count, seed)
+    results = {}
+    for name in names or BENCHMARKS:
+        best = None
+        for r in range(repeat):
+            start = time.perf_counter()
+            ops = BENCHMARKS[name](positions)
+            seconds = time.perf_counter() - start
+            if best is None or seconds < best[1]:
+                best = (ops, seconds)
+        results[name] = {'ops': best[0], 'seconds': best[1],
+                         'ops_per_sec': best[0] / best[1] if best[1] > 0 else float('inf')}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Teeko2Player hot paths")
+    parser.add_argument('names', nargs='*', help="benchmarks to run: " + ", ".join(BENCHMARKS))
+    parser.add_argument('--positions', type=int, default=None,
+                        help="sample positions searched (default 200, or 20 with --memory, "
+                             "whose deepcopy path is slow)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', default=None, help="also write the results to this file")
+    parser.add_argument('--memory', action='store_true',
+                        help="compare peak memory of the successor paths instead")
+    parser.add_argument('--depth', type=int, default=2, help="search depth for --memory")
+    args = parser.parse_args()
+    if args.memory:
+        count = args.positions if args.positions is not None else 20
+        print(str(count) + " positions, depth " + str(args.depth))
+        results = memory(count, args.seed, args.depth)
+        for name, r in results.items():
+            print(name.ljust(10) + str(r['peak_bytes']).rjust(10) + " bytes peak" +
+                  str(round(r['bytes_per_node'], 2)).rjust(10) + " bytes/node" +
+                  str(r['nodes']).rjust(9) + " nodes")
+    else:
+        count = args.positions if args.positions is not None else 200
+        results = run(args.names, count, args.seed, args.repeat)
+        for name, r in results.items():
+            print(name.ljust(14) + str(round(r['ops_per_sec'])).rjust(12) + " ops/s")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
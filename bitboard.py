@@ -0,0 +1,402 @@
+""" Compact board engine for Teeko2.
+
+A position is stored as a pair of 25-bit integers, one per color, ordered like
+Teeko2Player.pieces (black first, then red). Bit (row * 5 + col) is set when
+that color has a marker on (row, col).
+"""
+
+PIECES = ['b', 'r']
+SIZE = 5
+FULL = (1 << (SIZE * SIZE)) - 1
+
+
+def bit(row, col):
+    """ Returns the single-bit mask for the square (row, col) """
+    return 1 << (row * SIZE + col)
+
+
+def square(index):
+    """ Returns the (row, col) tuple for a bit index """
+    return divmod(index, SIZE)
+
+
+def _mask(cells):
+    m = 0
+    for (row, col) in cells:
+        m |= bit(row, col)
+    return m
+
+
+try:
+    popcount = int.bit_count
+except AttributeError: # Python < 3.10
+    def popcount(x):
+        return bin(x).count('1')
+
+
+############################################################################
+#
+# Precomputed masks
+#
+############################################################################
+
+# four in a row: horizontal, vertical, \ diagonal and / diagonal
+WIN_LINES = (
+    [_mask([(row, col + k) for k in range(4)]) for row in range(5) for col in range(2)] +
+    [_mask([(row + k, col) for k in range(4)]) for row in range(2) for col in range(5)] +
+    [_mask([(row + k, col + k) for k in range(4)]) for row in range(2) for col in range(2)] +
+    [_mask([(row + k, col - k) for k in range(4)]) for row in range(2) for col in range(3, 5)]
+)
+
+# diamonds: the four orthogonal neighbors of an interior square, which must
+# itself stay empty for the diamond to count
+DIAMONDS = [
+    (_mask([(row - 1, col), (row, col - 1), (row, col + 1), (row + 1, col)]), bit(row, col))
+    for row in range(1, 4) for col in range(1, 4)
+]
+
+# lines scored by the heuristic: full rows and columns plus the length-4
+# diagonals; diamonds are scored through DIAMONDS
+HEURISTIC_LINES = (
+    [_mask([(row, col) for col in range(5)]) for row in range(5)] +
+    [_mask([(row, col) for row in range(5)]) for col in range(5)] +
+    [_mask([(row - k, col + k) for k in range(4)]) for row in range(3, 5) for col in range(2)] +
+    [_mask([(row + k, col + k) for k in range(4)]) for row in range(2) for col in range(2)]
+)
+
+# squares reachable in one step (including diagonals) from each square
+ADJACENT = [
+    _mask([(r, c) for r in range(row - 1, row + 2) for c in range(col - 1, col + 2)
+           if 0 <= r < SIZE and 0 <= c < SIZE and (r, c) != (row, col)])
+    for row in range(SIZE) for col in range(SIZE)
+]
+
+# the same neighborhoods as tuples of bit indices, and (row, col) of each index
+NEIGHBORS = [tuple(j for j in range(SIZE * SIZE) if ADJACENT[i] >> j & 1) for i in range(SIZE * SIZE)]
+SQUARES = [square(i) for i in range(SIZE * SIZE)]
+
+# the 8 symmetries of the square as maps (row, col) -> (row, col); every set of
+# lines above is closed under them
+_SYMMETRY_MAPS = [
+    lambda r, c: (r, c),
+    lambda r, c: (c, 4 - r),
+    lambda r, c: (4 - r, 4 - c),
+    lambda r, c: (4 - c, r),
+    lambda r, c: (r, 4 - c),
+    lambda r, c: (4 - r, c),
+    lambda r, c: (c, r),
+    lambda r, c: (4 - c, 4 - r),
+]
+# SYMMETRIES[k][i] is the index square i is sent to by symmetry k
+SYMMETRIES = [[f(*square(i))[0] * SIZE + f(*square(i))[1] for i in range(SIZE * SIZE)]
+              for f in _SYMMETRY_MAPS]
+INVERSE = [next(j for j in range(8) if all(SYMMETRIES[j][SYMMETRIES[k][i]] == i for i in range(25)))
+           for k in range(8)]
+# _ROW_IMAGES[k][row][pattern] is the image under symmetry k of the markers given
+# by the 5-bit pattern on that row, so a bitboard transforms with 5 lookups
+_ROW_IMAGES = [[[sum(1 << sym[row * SIZE + col] for col in range(SIZE) if pattern >> col & 1)
+                 for pattern in range(1 << SIZE)]
+                for row in range(SIZE)]
+               for sym in SYMMETRIES]
+
+
+############################################################################
+#
+# Conversions between list-of-lists boards and bitboards
+#
+############################################################################
+
+def to_bits(state):
+    """ Converts a 5x5 list-of-lists board into a (black, red) bitboard pair.
+    Bitboard pairs are passed through unchanged.
+    """
+    if isinstance(state, tuple):
+        return state
+    black = red = 0
+    for row in range(SIZE):
+        for col in range(SIZE):
+            cell = state[row][col]
+            if cell == PIECES[0]:
+                black |= bit(row, col)
+            elif cell == PIECES[1]:
+                red |= bit(row, col)
+    return (black, red)
+
+
+def to_state(bits):
+    """ Converts a (black, red) bitboard pair into a 5x5 list-of-lists board """
+    state = [[' '] * SIZE for i in range(SIZE)]
+    for (piece, x) in zip(PIECES, bits):
+        while x:
+            low = x & -x
+            (row, col) = SQUARES[low.bit_length() - 1]
+            state[row][col] = piece
+            x ^= low
+    return state
+
+
+def pack(bits):
+    """ Packs a (black, red) bitboard pair into one 50-bit integer """
+    return bits[0] | (bits[1] << 25)
+
+
+def unpack(packed):
+    """ Inverse of pack() """
+    return (packed & FULL, packed >> 25)
+
+
+def transform(x, k):
+    """ Image of the bitboard x under symmetry k (see SYMMETRIES) """
+    rows = _ROW_IMAGES[k]
+    return (rows[0][x & 31] | rows[1][(x >> 5) & 31] | rows[2][(x >> 10) & 31] |
+            rows[3][(x >> 15) & 31] | rows[4][x >> 20])
+
+
+def canonical(bits):
+    """ Returns (canonical, k): the image of a (black, red) pair under the
+    symmetry k that minimizes its pack() value. Symmetric positions share the
+    same canonical pair.
+    """
+    best = None
+    best_k = 0
+    for k in range(8):
+        packed = transform(bits[0], k) | (transform(bits[1], k) << 25)
+        if best is None or packed < best:
+            best = packed
+            best_k = k
+    return (unpack(best), best_k)
+
+
+# _HALF_IMAGES[k] = (low, high, low << 25, high << 25): images under symmetry k
+# of the low 13 and high 12 bits of a bitboard, shifted into the red half of a
+# pack()ed pair for the last two. Built on first use of canonical_key().
+_HALF_IMAGES = None
+
+
+def canonical_key(bits):
+    """ pack() of canonical(bits)[0], with four table lookups per symmetry """
+    global _HALF_IMAGES
+    if _HALF_IMAGES is None:
+        _HALF_IMAGES = []
+        for k in range(8):
+            low = [transform(x, k) for x in range(1 << 13)]
+            high = [transform(x << 13, k) for x in range(1 << 12)]
+            _HALF_IMAGES.append((low, high, [x << 25 for x in low], [x << 25 for x in high]))
+    (black, red) = bits
+    bl = black & 8191
+    bh = black >> 13
+    rl = red & 8191
+    rh = red >> 13
+    return min([low[bl] | high[bh] | red_low[rl] | red_high[rh]
+                for (low, high, red_low, red_high) in _HALF_IMAGES])
+
+
+############################################################################
+#
+# Move generation
+#
+############################################################################
+
+def from_move_list(move):
+    """ Converts a [(row, col)] or [(row, col), (source_row, source_col)] move, as
+    used by Teeko2Player.make_move, into a (src, dst) pair of bit indices.
+    """
+    dst = move[0][0] * SIZE + move[0][1]
+    if len(move) > 1 and move[1] is not None and move[1][0] is not None:
+        return (move[1][0] * SIZE + move[1][1], dst)
+    return (None, dst)
+
+
+def to_move_list(src, dst):
+    """ Inverse of from_move_list() """
+    if src is None:
+        return [SQUARES[dst]]
+    return [SQUARES[dst], SQUARES[src]]
+
+
+def iter_moves(mine, theirs):
+    """ Lazily yields every legal move of the color whose markers are `mine`.
+
+    Moves are (src, dst) pairs of bit indices, with src None while that color
+    still has markers to drop. Each move is produced exactly once, in order of
+    source square and then destination square.
+    """
+    occupied = mine | theirs
+    if popcount(mine) < 4:
+        for dst in range(SIZE * SIZE):
+            if not occupied >> dst & 1:
+                yield (None, dst)
+    else:
+        x = mine
+        while x:
+            low = x & -x
+            src = low.bit_length() - 1
+            for dst in NEIGHBORS[src]:
+                if not occupied >> dst & 1:
+                    yield (src, dst)
+            x ^= low
+
+
+def iter_children(bits, turn):
+    """ Lazily yields the (black, red) pair after each move of color turn, in
+    iter_moves() order, without building the moves themselves.
+    """
+    mine, theirs = bits[turn], bits[1 - turn]
+    occupied = mine | theirs
+    if popcount(mine) < 4:
+        for dst in range(SIZE * SIZE):
+            if not occupied >> dst & 1:
+                moved = mine | (1 << dst)
+                yield (moved, theirs) if turn == 0 else (theirs, moved)
+    else:
+        x = mine
+        while x:
+            low = x & -x
+            lifted = mine ^ low
+            for dst in NEIGHBORS[low.bit_length() - 1]:
+                if not occupied >> dst & 1:
+                    moved = lifted | (1 << dst)
+                    yield (moved, theirs) if turn == 0 else (theirs, moved)
+            x ^= low
+
+
+def is_legal(mine, theirs, src, dst):
+    """ True if (src, dst) is a legal move for the color whose markers are `mine` """
+    if (mine | theirs) >> dst & 1:
+        return False
+    if popcount(mine) < 4:
+        return src is None
+    return src is not None and mine >> src & 1 and dst in NEIGHBORS[src]
+
+
+def iter_moves_first(mine, theirs, hints):
+    """ Like iter_moves(), but yields the legal moves among hints first, in the
+    order given, and then the remaining moves in iter_moves() order.
+    """
+    tried = []
+    for move in hints:
+        if move is not None and move not in tried and is_legal(mine, theirs, *move):
+            tried.append(move)
+            yield move
+    for move in iter_moves(mine, theirs):
+        if move not in tried:
+            yield move
+
+
+def apply_move(bits, turn, src, dst):
+    """ Returns the bitboard pair after color `turn` plays (src, dst) """
+    moved = bits[turn] | (1 << dst)
+    if src is not None:
+        moved ^= 1 << src
+    return (moved, bits[1]) if turn == 0 else (bits[0], moved)
+
+
+############################################################################
+#
+# Evaluation
+#
+############################################################################
+
+# per-color win profiles: None if a line of four is complete, otherwise the
+# centers of completed diamond rings (a win only while the center is empty)
+_wins = {}
+
+
+def _win_profile(mine):
+    if any(mine & m == m for m in WIN_LINES):
+        profile = None
+    else:
+        profile = tuple(center for (ring, center) in DIAMONDS if mine & ring == ring)
+    _wins[mine] = profile
+    return profile
+
+
+def has_won(mine, theirs):
+    """ True if the markers in `mine` form a line of four or a diamond """
+    try:
+        profile = _wins[mine]
+    except KeyError:
+        profile = _win_profile(mine)
+    if profile is None:
+        return True
+    occupied = mine | theirs
+    for center in profile:
+        if not occupied & center:
+            return True
+    return False
+
+
+def winner(bits):
+    """ Returns 0 if black has won, 1 if red has won and None otherwise """
+    black, red = bits
+    if has_won(black, red):
+        return 0
+    if has_won(red, black):
+        return 1
+    return None
+
+
+# per-color line profiles, keyed on that color's bitboard. A color never has
+# more than four markers, so this holds at most sum(C(25, k), k <= 4) entries.
+_profiles = {}
+
+
+def _line_profile(mine):
+    count = popcount
+    best = 0
+    for m in HEURISTIC_LINES:
+        c = count(mine & m)
+        if c > best:
+            best = c
+    # only diamonds that beat the straight lines matter, best first
+    diamonds = sorted(((count(mine & ring), center) for (ring, center) in DIAMONDS
+                       if count(mine & ring) > best), reverse=True)
+    profile = (best, tuple(diamonds))
+    _profiles[mine] = profile
+    return profile
+
+
+def longest_line(mine, theirs):
+    """ Largest number of `mine` markers on a single heuristic line or around an
+    empty diamond center.
+    """
+    try:
+        profile = _profiles[mine]
+    except KeyError:
+        profile = _line_profile(mine)
+    occupied = mine | theirs
+    for (c, center) in profile[1]:
+        if not occupied & center:
+            return c
+    return profile[0]
+
+
+def heuristic(mine, theirs):
+    """ Static score in [-1, 1] comparing the longest lines of both colors """
+    return line_score(longest_line(mine, theirs), longest_line(theirs, mine))
+
+
+def line_score(mymax, oppmax):
+    """ heuristic() given both colors' longest_line() """
+    if mymax == oppmax:
+        return 0
+    if mymax > oppmax:
+        return mymax / 6.0
+    return (-1) * oppmax / 6.0
+
+
+
+def threats(mine, theirs):
+    """ Empty squares that would complete a line of four or a diamond ring for
+    `mine` if a marker of that color landed there.
+    """
+    count = popcount
+    empty = FULL & ~(mine | theirs)
+    squares = 0
+    for m in WIN_LINES:
+        if count(mine & m) == 3:
+            squares |= m & empty
+    for (ring, center) in DIAMONDS:
+        if empty & center and count(mine & ring) == 3:
+            squares |= ring & empty
+    return squares
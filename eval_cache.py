@@ -0,0 +1,94 @@
+""" LRU cache of static evaluations keyed on symmetry-canonical positions.
+
+Every line the evaluation looks at (rows, columns, diagonals, diamonds) is
+mapped onto another such line by the 8 symmetries of the board, so the static
+score is the same for all images of a position, and the score for red is the
+negation of the score for black. The cache stores the score for black once
+per symmetry class, keyed on bitboard.canonical_key(), and serves it for
+either color. Teeko2Player caches the scores of its
+linear_eval.LinearEvaluator here; the line heuristic and the winner take a few
+memoized mask tests, less than any lookup, and are never cached.
+
+Canonicalizing costs about half a linear evaluation, so positions are first
+looked up as they are in a plain dict of recently seen (black, red) pairs.
+Symmetric twins are common only while markers are being dropped: once all
+eight are on the board a position is keyed as it is, without canonicalizing.
+"""
+from collections import OrderedDict
+
+import bitboard
+
+
+class EvalCache:
+    """ Bounded map from canonical position (the position itself after the
+    drop phase) to the static score for black, least recently used entries
+    evicted first.
+
+    Args:
+        max_entries (int): most positions held, in each of the canonical and
+            the exact map
+    """
+
+    def __init__(self, max_entries=1 << 16):
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.exact = {} # (black, red) -> score, emptied whenever it fills up
+        self.linear = None # the evaluator the scores were made with
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def lookup(self, bits, linear=None):
+        """ Static score for black of a (black, red) pair: linear.score(bits,
+        0), or bitboard.heuristic(black, red) if linear is None. A different
+        linear than the last call's empties the cache.
+        """
+        score = self.exact.get(bits)
+        if score is not None and linear is self.linear:
+            self.stats['hits'] += 1
+            return score
+        if linear is not self.linear:
+            self.clear()
+            self.linear = linear
+        (black, red) = bits
+        if bitboard.popcount(black | red) < 8:
+            key = bitboard.canonical_key(bits)
+        else:
+            key = bits
+        entries = self.entries
+        score = entries.get(key)
+        if score is not None:
+            self.stats['hits'] += 1
+            entries.move_to_end(key)
+        else:
+            self.stats['misses'] += 1
+            if linear is not None:
+                score = linear.score(bits, 0)
+            else:
+                score = bitboard.heuristic(black, red)
+            entries[key] = score
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        if len(self.exact) >= self.max_entries:
+            self.exact.clear()
+        self.exact[bits] = score
+        return score
+
+    def heuristic(self, bits, me, linear=None):
+        """ linear.score(bits, me), or bitboard.heuristic(bits[me], bits[1 - me])
+        if linear is None
+        """
+        score = self.exact.get(bits) # lookup()'s first step, without the call
+        if score is not None and linear is self.linear:
+            self.stats['hits'] += 1
+        else:
+            score = self.lookup(bits, linear)
+        return -score if me else score
+
+    def clear(self):
+        self.entries.clear()
+        self.exact.clear()
+
+    def __len__(self):
+        return len(self.entries)
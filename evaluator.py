@@ -0,0 +1,156 @@
+""" Incrementally evaluated Teeko2 board for make/unmake search.
+
+IncrementalBoard keeps, for each color, the number of its markers on every
+line scored by the heuristic (rows, columns, length-4 diagonals and diamond
+rings) and on every winning line. The counts are packed into one integer per
+color, 3 bits per line, so placing, moving or removing a marker updates all the
+lines through the changed square with a single addition, and the heuristic
+score and the winner are read off with a few mask operations.
+"""
+import bitboard
+import transposition
+
+_CELLS = bitboard.SIZE * bitboard.SIZE
+_BITS = 3 # bits per line counter; no line ever holds more than 5 markers
+
+# lines are numbered rows, columns and diagonals first (HEURISTIC_LINES order),
+# then diamond rings (DIAMONDS order), then four-in-a-row lines (WIN_LINES order)
+LINES = (list(bitboard.HEURISTIC_LINES) + [ring for (ring, center) in bitboard.DIAMONDS]
+         + list(bitboard.WIN_LINES))
+_DIAMOND_FIRST = len(bitboard.HEURISTIC_LINES)
+_WIN_FIRST = _DIAMOND_FIRST + len(bitboard.DIAMONDS)
+
+
+def _fields(lines):
+    """ Mask covering the whole counter of each listed line """
+    m = 0
+    for line in lines:
+        m |= 7 << (_BITS * line)
+    return m
+
+
+ONES = sum(1 << (_BITS * line) for line in range(len(LINES)))
+STRAIGHT_FIELDS = _fields(range(_DIAMOND_FIRST))
+DIAMOND_FIELDS = _fields(range(_DIAMOND_FIRST, _WIN_FIRST))
+WIN_FIELDS = _fields(range(_WIN_FIRST, len(LINES)))
+
+# adding INCREMENT[i] to a color's counters records a marker on square i
+INCREMENT = [sum(1 << (_BITS * line) for line, m in enumerate(LINES) if m >> i & 1)
+             for i in range(_CELLS)]
+# counter of the diamond centered on square i, which only counts while i is empty
+CENTER_FIELD = [_fields([_DIAMOND_FIRST + k for k, (ring, center) in enumerate(bitboard.DIAMONDS)
+                         if center >> i & 1])
+                for i in range(_CELLS)]
+
+
+class IncrementalBoard:
+    """ A mutable position with per-line marker counts.
+
+    Attributes:
+        bits (list): [black, red] bitboards
+        counts (list): per color, the packed line counters (see count())
+        active (int): counters that take part in the heuristic and diamond wins,
+            i.e. every straight line plus the diamonds whose center is empty
+        key (int): Zobrist hash of the markers (see transposition.zobrist)
+    """
+    __slots__ = ('bits', 'counts', 'active', 'key')
+
+    def __init__(self, state=(0, 0)):
+        self.bits = [0, 0]
+        self.counts = [0, 0]
+        self.active = STRAIGHT_FIELDS | DIAMOND_FIELDS
+        self.key = 0
+        for color, x in enumerate(bitboard.to_bits(state)):
+            while x:
+                low = x & -x
+                self.place(color, low.bit_length() - 1)
+                x ^= low
+
+    def place(self, color, i):
+        """ Puts a marker of color (0 black, 1 red) on the empty square index i """
+        self.bits[color] |= 1 << i
+        self.counts[color] += INCREMENT[i]
+        self.active &= ~CENTER_FIELD[i]
+        self.key ^= transposition.ZOBRIST[color][i]
+
+    def remove(self, color, i):
+        """ Takes the marker of color off the square index i """
+        self.bits[color] ^= 1 << i
+        self.counts[color] -= INCREMENT[i]
+        self.active |= CENTER_FIELD[i]
+        self.key ^= transposition.ZOBRIST[color][i]
+
+    def make(self, turn, src, dst):
+        """ Plays the (src, dst) move of bitboard.iter_moves for color turn """
+        if src is not None:
+            self.remove(turn, src)
+        self.place(turn, dst)
+
+    def unmake(self, turn, src, dst):
+        """ Takes back a move played with make() """
+        self.remove(turn, dst)
+        if src is not None:
+            self.place(turn, src)
+
+    def successors(self, turn, moves=None):
+        """ Lazily plays each move of color turn on this board in place, yields it
+        while it is on the board and takes it back before going on, so no child
+        position is ever copied. A caller that stops early should close() the
+        generator (as a for loop's break does in CPython), which takes back the
+        move still on the board.
+
+        Args:
+            moves: the (src, dst) moves to play, in order; by default every legal
+                move, generated as they are needed
+        """
+        if moves is None:
+            moves = bitboard.iter_moves(self.bits[turn], self.bits[1 - turn])
+        for (src, dst) in moves:
+            self.make(turn, src, dst)
+            try:
+                yield (src, dst)
+            finally:
+                self.unmake(turn, src, dst)
+
+    def count(self, color, line):
+        """ Markers of color on line, numbered as in LINES """
+        return (self.counts[color] >> (_BITS * line)) & 7
+
+    def has_won(self, color):
+        """ True if color has four on a winning line or around an empty center """
+        full = self.counts[color] & (WIN_FIELDS | self.active & DIAMOND_FIELDS)
+        return bool(full & (ONES << 2))
+
+    def winner(self):
+        """ Returns 0 if black has won, 1 if red has won and None otherwise """
+        if self.has_won(0):
+            return 0
+        if self.has_won(1):
+            return 1
+        return None
+
+    def longest_line(self, color):
+        """ Same as bitboard.longest_line for this color """
+        x = self.counts[color] & self.active
+        if x & (ONES << 2):
+            # a counter at 5 (0b101) only happens on a full row or column
+            return 5 if x & (x << 2) & (ONES << 2) else 4
+        if x & (x >> 1) & ONES:
+            return 3
+        if x & (ONES << 1):
+            return 2
+        return 1 if x else 0
+
+    def heuristic(self, color):
+        """ Same as bitboard.heuristic scored for this color """
+        mymax = self.longest_line(color)
+        oppmax = self.longest_line(1 - color)
+        if mymax == oppmax:
+            return 0
+        if mymax > oppmax:
+            return mymax / 6.0
+        return (-1) * oppmax / 6.0
+
+    def position(self):
+        """ Returns the current (black, red) bitboard pair """
+        return (self.bits[0], self.bits[1])
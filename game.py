@@ -1,70 +1,122 @@
+import os
 import random
-import copy 
+import time
+
+import bitboard
+import evaluator
+import mcts
+import opening_book
+import parallel
+import threats
+import transposition
+
+MAX_DEPTH = 64 # deepest iteration tried by iterative deepening
+BATCH_SIZE = 4096 # leaves evaluated per batched.leaf_values call
+# where tablebase.py builds the move phase table by default
+TABLEBASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'teeko2_moves.tb')
+
+
+def default_tablebase():
+    """ A tablebase.Tablebase of the table at TABLEBASE_PATH, or None if it has
+    not been built; tablebase is only imported when there is a table to use.
+    """
+    if not os.path.exists(TABLEBASE_PATH):
+        return None
+    import tablebase
+    return tablebase.Tablebase(TABLEBASE_PATH)
+
+
+class SearchTimeout(Exception):
+    """ Raised inside the search when the deadline of a timed make_move passes """
 
 class Teeko2Player:
     """ An object representation for an AI game player for the game Teeko2.
     """
-    board = [[' ' for j in range(5)] for i in range(5)]
     pieces = ['b', 'r']
 
-    def __init__(self):
+    def __init__(self, tt_entries=1 << 16, tt=None):
         """ Initializes a Teeko2Player object by randomly selecting red or black as its
         piece color.
+
+        Args:
+            tt_entries (int): size of the transposition table kept for the whole
+                game by the alpha-beta search
+            tt (transposition.TranspositionTable): a table to use instead, e.g. one
+                shared by many players; entries are keyed on the searching color
         """
         self.my_piece = random.choice(self.pieces)
         self.opp = self.pieces[0] if self.my_piece == self.pieces[1] else self.pieces[1]
-        self.drop_phase = True
-        self.piece_count = 0
+        self.position = (0, 0) # this game's (black, red) bitboard pair
+        self.stats = {'nodes': 0, 'cutoffs': 0}
+        self.killers = {}
+        self.tt = tt if tt is not None else transposition.TranspositionTable(tt_entries)
+        self.deadline = float('inf')
+        self.parallel = None
+        self.mcts = None
+        self.tablebase = default_tablebase()
+        self.book = opening_book.OpeningBook()
+        self.eval_cache = None # an eval_cache.EvalCache of self.linear's scores
+        self.linear = None # a linear_eval.LinearEvaluator scoring leaves in place of the lines
+        self.ponder = None # a ponder.Ponderer searching the expected reply between moves
+        self.tactics = True # play moves found by threats.forced_move without searching
     
+    @property
+    def board(self):
+        """ The current state of the game as a 5x5 list of lists (a fresh copy) """
+        return bitboard.to_state(self.position)
+
+    @property
+    def piece_count(self):
+        """ Number of markers on the board """
+        return bitboard.popcount(self.position[0] | self.position[1])
+
+    @property
+    def drop_phase(self):
+        """ True while this player still has markers to drop """
+        return bitboard.popcount(self.position[self.pieces.index(self.my_piece)]) < 4
+
     def succ(self, state, turn=0):
-        
+        """ Generates every position reachable by one move of self.pieces[turn].
+
+        Args:
+            state: a list-of-lists board or a (black, red) bitboard pair
+
+        Returns:
+            list: [child, (row, col), source] entries where child is a bitboard
+                pair, (row, col) is the destination and source is the (row, col)
+                of the moved piece, or 0 for a drop
+        """
+        bits = bitboard.to_bits(state)
+        squares = bitboard.SQUARES
         states = []
-        
-        if self.drop_phase:
-            for row in range(5):
-                for col in range(5):
-                    if state[row][col] == ' ':
-                        temp = copy.deepcopy(state)
-                        temp[row][col] = self.pieces[turn]
-                        child = [temp, (row,col), 0]
-                        states.append(child)
-                        del temp
-                        del child
-                    
-        else:
-            for row in range(5):
-                for col in range(5):
-                    if state[row][col] == self.pieces[turn]:
-                        valid_slots = self.get_valid_adjacents(row,col,state)
-                        for slots in valid_slots:
-                            temp = copy.deepcopy(state)
-                            temp[row][col] = ' '
-                            temp[slots[0]][slots[1]] = self.pieces[turn]
-                            child = [temp, (slots[0],slots[1]), (row,col)]
-                            if child not in states:
-                                states.append(child)
-                            del temp
-                            del child
-        
-        return states 
-    
+        for (src, dst) in bitboard.iter_moves(bits[turn], bits[1 - turn]):
+            child = bitboard.apply_move(bits, turn, src, dst)
+            states.append([child, squares[dst], 0 if src is None else squares[src]])
+        return states
+
+    def legal_moves(self, state, turn=0):
+        """ Lazily yields the legal moves of self.pieces[turn] in the format used by
+        make_move() and opponent_move(): [(row, col)] for drops and
+        [(row, col), (source_row, source_col)] for moves.
+        """
+        bits = bitboard.to_bits(state)
+        squares = bitboard.SQUARES
+        for (src, dst) in bitboard.iter_moves(bits[turn], bits[1 - turn]):
+            if src is None:
+                yield [squares[dst]]
+            else:
+                yield [squares[dst], squares[src]]
+
     def get_valid_adjacents(self,a,b,state):
+        """ Returns the empty squares next to (a, b) as [row, col] lists """
         adjacentSlots = []
-        directions = [
-            [-1, -1], [-1, 0], [-1, +1],
-            [0, -1],           [0, +1],
-            [+1, -1], [+1, 0], [+1, +1],
-        ]
-
-        for i in directions:
-            x = a + i[0]
-            y = b + i[1]
-
-            if( 0 <= x <= 4 and 0 <= y <= 4) and (state[x][y] == ' '):
+        for i in bitboard.NEIGHBORS[a * 5 + b]:
+            (x, y) = bitboard.SQUARES[i]
+            if state[x][y] == ' ':
                 adjacentSlots.append([x,y])
         return adjacentSlots
-    
-    def make_move(self, state):
+
+    def make_move(self, state, depth=1, search='minimax', time_limit_ms=None):
         """ Selects a (row, col) space for the next move. You may assume that whenever
         this function is called, it is this player's turn to move.
 
@@ -78,6 +130,29 @@ class Teeko2Player:
                 In the "drop phase", the state will contain less than 8 elements which
                 are not ' ' (a single space character).
 
+            depth (int): plies searched below each of this player's candidate moves
+            search (str): 'minimax' for the plain max_value search, 'batched' for
+                the same search with its leaves scored in NumPy batches (see
+                batched_values), 'alphabeta' for alpha_beta with move ordering, or
+                'parallel' to score the root moves with alpha_beta across the
+                process pool in self.parallel (a parallel.ParallelSearch, created
+                on first use). All of them pick a move with the same minimax
+                score; nodes searched and cutoffs are left in self.stats.
+                'mcts' ignores depth and runs the Monte Carlo tree search in
+                self.mcts (an mcts.MCTS, created on first use) instead.
+            time_limit_ms (float): if given, ignore depth and search and deepen an
+                alpha-beta search until the time budget runs out; the depth of the
+                last completed iteration is left in self.stats['depth']. With
+                search='mcts', the time budget of the tree search.
+
+        With self.ponder set, a search promoted from pondering on the opponent's
+        time is played when it covers this position (see ponder.Ponderer.take),
+        and pondering on the expected reply starts before returning.
+
+        Moves found by precomputed_move() are played without searching, and so
+        are immediate wins, forced blocks and moves setting up a double threat
+        (see threats.forced_move) unless self.tactics is False.
+
         Return:
             move (list): a list of move tuples such that its format is
                     [(row, col), (source_row, source_col)]
@@ -92,50 +167,52 @@ class Teeko2Player:
         """
 
         turn = self.pieces.index(self.my_piece)
-        if not self.drop_phase:
-            # TODO: choose a piece to move and remove it from the board
-            # (You may move this condition anywhere, just be sure to handle it)
-            #
-            # Until this part is implemented and the move list is updated
-            # accordingly, the AI will not follow the rules after the drop phase
-            
-            succ_states = self.succ(state, turn)
-#            random.shuffle(succ_states)
-            max_score = float('-inf')
-            for cand_state in succ_states:
-                score = self.max_value(cand_state[0], depth = 1, turn = (turn+1)%2)
-
-                if score > max_score:
-                    max_score = score 
-                    move = []
-#                   cand = random.choice(succ_states)
-                    move.append(cand_state[1])
-                    move.append(cand_state[2])
-            return move
-
-        # select an unoccupied space randomly
-        # TODO: implement a minimax algorithm to play better
+        state = bitboard.to_bits(state)
+        best = None
+        known = None
+        if self.ponder is not None:
+            best = self.ponder.take(state, depth, search, time_limit_ms)
+        if best is None:
+            known = self.precomputed_move(state, turn)
+        if known is None and best is None and self.tactics:
+            known = threats.forced_move(state, turn)
+            if known is not None:
+                self.stats = {'nodes': 0, 'cutoffs': 0}
+        if known is not None:
+            best = self.succ_entry(state, turn, known)
+        if best is None and search == 'mcts':
+            if self.mcts is None:
+                self.mcts = mcts.MCTS()
+            best = self.succ_entry(state, turn, self.mcts.search(state, turn, time_limit_ms))
+            self.stats = dict(self.mcts.stats)
+        elif best is None and time_limit_ms is not None:
+            best = self.iterative_deepening(state, turn, time_limit_ms)
+        elif best is None:
+            best = self.search_root(state, turn, depth, search)
+        if self.ponder is not None:
+            self.ponder.start(best[0], 1 - turn, depth, search, time_limit_ms)
+
+        if bitboard.popcount(state[turn]) >= 4:
+            move = [best[1], best[2]]
         else:
-            succ_states = self.succ(state, turn)
-#            random.shuffle(succ_states)
-            max_score = float('-inf')
-            for cand_state in succ_states:
-                score = self.max_value(cand_state[0], depth = 1, turn = (turn+1)%2)
-
-                if score > max_score:
-                    max_score = score 
-                    move = []
-#                   cand = random.choice(succ_states)
-                    move.insert(0,cand_state[1])
             # ensure the destination (row,col) tuple is at the beginning of the move list
-#            (row,col) = random.choice(succ_states)[1]
-#            move.insert(0, (row, col))
-            
-        self.piece_count += 2
-        if self.piece_count < 8:
-            self.drop_phase = True
-        else:
-            self.drop_phase = False
+            move = [best[1]]
+        return move
+
+    def precomputed_move(self, state, turn):
+        """ Looks the position up in self.book (an opening_book.OpeningBook) during
+        the drop phase and in self.tablebase (a tablebase.Tablebase) after it.
+        Either may be None to always search.
+
+        Returns:
+            tuple: a (src, dst) move as yielded by bitboard.iter_moves, or None if
+                neither table has an answer
+        """
+        move = None
+        if self.book is not None:
+            move = self.book.move(state, turn)
+        if move is None and self.tablebase is not None:
+            move = self.tablebase.best_move(state, turn)
         return move
 
     def opponent_move(self, move):
@@ -151,10 +228,11 @@ class Teeko2Player:
                 the drop phase, this list should contain ONLY THE FIRST tuple.
         """
         # validate input
+        board = self.board
         if len(move) > 1:
             source_row = move[1][0]
             source_col = move[1][1]
-            if source_row != None and self.board[source_row][source_col] != self.opp:
+            if source_row != None and board[source_row][source_col] != self.opp:
                 self.print_board()
                 print(move)
                 raise Exception("You don't have a piece there!")
@@ -162,10 +240,12 @@ class Teeko2Player:
                 self.print_board()
                 print(move)
                 raise Exception('Illegal move: Can only move to an adjacent space')
-        if self.board[move[0][0]][move[0][1]] != ' ':
+        if board[move[0][0]][move[0][1]] != ' ':
             raise Exception("Illegal move detected")
         # make move
         self.place_piece(move, self.opp)
+        if self.ponder is not None:
+            self.ponder.opponent_moved(self.position)
 
     def place_piece(self, move, piece):
         """ Modifies the board representation using the specified move and piece
@@ -182,255 +262,362 @@ class Teeko2Player:
                 is called.
             piece (str): the piece ('b' or 'r') to place on the board
         """
-        if len(move) > 1:
-            self.board[move[1][0]][move[1][1]] = ' '
-#        print(move)
-        self.board[move[0][0]][move[0][1]] = piece
+        (src, dst) = bitboard.from_move_list(move)
+        self.position = bitboard.apply_move(self.position, self.pieces.index(piece), src, dst)
 
     def print_board(self):
         """ Formatted printing for the board """
-        for row in range(len(self.board)):
+        board = self.board
+        for row in range(len(board)):
             line = str(row)+": "
-            for cell in self.board[row]:
+            for cell in board[row]:
                 line += cell + " "
             print(line)
         print("   A B C D E")
     
     def heuristic_game_value(self, state, piece): # check largest number of pieces connected
-        if piece == 'b':
-            mine = 'b'
-            oppo = 'r'
-
-        elif piece == 'r':
-            mine = 'r'
-            oppo = 'b'
-
-        # for horizontal
-        mymax = 0
-        oppmax = 0
-        mycnt = 0
-        oppcnt = 0
-
-        for i in range(len(state)):
-            for j in range(len(state)):
-                if state[i][j] == mine:
-                    mycnt += 1
-            if mycnt > mymax:
-                mymax = mycnt
-            mycnt = 0
-        i=0
-        j=0
-        for i in range(len(state)):
-            for j in range(len(state)):
-                if state[i][j] == oppo:
-                    oppcnt += 1
-            if oppcnt > oppmax:
-                oppmax = oppcnt
-            oppcnt = 0
-
-        # for vertical
-        for i in range(len(state)):
-            for j in range(len(state)):
-                if state[j][i] == mine:
-                    mycnt += 1
-            if mycnt > mymax:
-                mymax = mycnt
-            mycnt = 0
-        i=0
-        j=0
-        for i in range(len(state)):
-            for j in range(len(state)):
-                if state[j][i] == oppo:
-                    oppcnt += 1
-            if oppcnt > oppmax:
-                oppmax = oppcnt
-            oppcnt = 0
-
-
-        # for / diagonal
-        mycnt = 0
-        oppcnt = 0
-
-        for row in range(3, 5):
-            for i in range(2):
-                if state[row][i] == mine:
-                    mycnt += 1
-                if state[row - 1][i + 1] == mine:
-                    mycnt += 1
-                if state[row - 2][i + 2] == mine:
-                    mycnt += 1
-                if state[row - 3][i + 3] == mine:
-                    mycnt += 1
-
-                if mycnt > mymax:
-                    mymax = mycnt
-                mycnt = 0
-
-        row = 0
-        i= 0
-
-        for row in range(3, 5):
-            for i in range(2):
-                if state[row][i] == oppo:
-                    oppcnt += 1
-                if state[row - 1][i + 1] == oppo:
-                    oppcnt += 1
-                if state[row - 2][i + 2] == oppo:
-                    oppcnt += 1
-                if state[row - 3][i + 3] == oppo:
-                    oppcnt += 1
-                if oppcnt > oppmax:
-                    oppmax = oppcnt
-                oppcnt = 0
-
-        # for \ diagonal
-        mycnt = 0
-        oppcnt = 0
-        row = 0
-        i = 0
-        for row in range(2):
-            for i in range(2):
-                if state[row][i] == mine:
-                    mycnt += 1
-                if state[row + 1][i + 1] == mine:
-                    mycnt += 1
-                if state[row + 2][i + 2] == mine:
-                    mycnt += 1
-                if state[row + 3][i + 3] == mine:
-                    mycnt += 1
-                if mycnt > mymax:
-                    mymax = mycnt
-                mycnt = 0
-
-        row = 0
-        i = 0
-        for row in range(2):
-            for i in range(2):
-                if state[row][i] == oppo:
-                    oppcnt += 1
-                if state[row + 1][i + 1] == oppo:
-                    oppcnt += 1
-                if state[row + 2][i + 2] == oppo:
-                    oppcnt += 1
-                if state[row + 3][i + 3] == oppo:
-                    oppcnt += 1
-                if oppcnt > oppmax:
-                    oppmax = oppcnt
-                oppcnt = 0
-
-        # for diamond
-        mycnt = 0
-        oppcnt = 0
-        row = 0
-        i = 0
-        for row in range(1,4):
-            for i in range(1,4):
-                if state[row][i] != ' ':
-                    continue
-                if state[row-1][i] == mine:
-                    mycnt += 1
-                if state[row][i + 1] == mine:
-                    mycnt += 1
-                if state[row + 1][i] == mine:
-                    mycnt += 1
-                if state[row][i - 1]== mine:
-                    mycnt += 1
-                if mycnt > mymax:
-                    mymax = mycnt
-                mycnt = 0
-
-        row = 0
-        i = 0
-        for row in range(1,4):
-            for i in range(1,4):
-                if state[row][i] != ' ':
-                    continue
-                if state[row-1][i] == oppo:
-                    oppcnt += 1
-                if state[row][i + 1] == oppo:
-                    oppcnt += 1
-                if state[row + 1][i] == oppo:
-                    oppcnt += 1
-                if state[row][i - 1]== oppo:
-                    oppcnt += 1
-                if oppcnt > oppmax:
-                    oppmax = oppcnt
-                oppcnt = 0
-
-        if mymax == oppmax:
-            return 0
-        if mymax >= oppmax:
-            return mymax/6.0 # if mine is longer than opponent, return positive float
-
-        return (-1) * oppmax/6.0 # if opponent is longer than mine, return negative float
-    
+        """ Compares the longest partial lines of both colors
+
+        Args:
+            state: a list-of-lists board or a (black, red) bitboard pair
+            piece (str): the color to score the position for
+
+        Returns:
+            float: mymax/6.0 if piece has the longer line, -oppmax/6.0 if the
+                opponent does, 0 if they are equal; self.linear_score() instead
+                if self.linear is set
+        """
+        bits = bitboard.to_bits(state)
+        turn = self.pieces.index(piece)
+        if self.linear is not None:
+            return self.linear_score(bits, turn)
+        return bitboard.heuristic(bits[turn], bits[1 - turn])
+
+    def linear_score(self, bits, me):
+        """ self.linear.score(bits, me), looked up in self.eval_cache if set. The
+        line heuristic is never cached: bitboard memoizes it per color already.
+        """
+        if self.eval_cache is not None:
+            # an IncrementalBoard's bits are a list
+            return self.eval_cache.heuristic(tuple(bits), me, self.linear)
+        return self.linear.score(bits, me)
+
     def max_value(self, state, depth, turn):
+        """ Minimax value for this player of a position with self.pieces[turn] to
+        move, searched depth plies deep. Children are generated one at a time by
+        bitboard.iter_children, so no list of successors is ever built, and a
+        node whose side to move can win on the spot is scored without them.
+        """
+        self.stats['nodes'] += 1
+        state = bitboard.to_bits(state)
         s = self.game_value(state)
         if s != 0:
             return s
         elif depth == 0:
             return self.heuristic_game_value(state, self.my_piece)
+        elif threats.winning_move(state, turn) is not None:
+            return 1 if self.pieces[turn] == self.my_piece else -1
         elif turn == self.pieces.index(self.my_piece):
-            children = self.succ(state,turn)
             max_score = float('-inf')
-            for y in children:
-                score = self.max_value(y[0],depth-1, (turn+1)%2)
+            for child in bitboard.iter_children(state, turn):
+                score = self.max_value(child, depth-1, (turn+1)%2)
                 max_score = max(score, max_score)
-#            print(max_score)
             return max_score
         else:
-            children = self.succ(state,turn)
             min_score = float('inf')
-            for y in children:
-                score = self.max_value(y[0],depth-1, (turn+1)%2)
+            for child in bitboard.iter_children(state, turn):
+                score = self.max_value(child, depth-1, (turn+1)%2)
                 min_score = min(score, min_score)
-#            print(min_score)
             return min_score
-                
-    
+
+    def batched_values(self, states, depth, turn):
+        """ Returns [self.max_value(s, depth, turn) for s in states], expanding the
+        whole tree first with batched_node and scoring its depth 0 nodes
+        BATCH_SIZE at a time with batched_leaves. Needs numpy.
+        """
+        values = []
+        pending = []
+
+        def add_leaves(children):
+            first = len(values) + len(pending)
+            pending.extend(children)
+            if len(pending) >= BATCH_SIZE:
+                values.extend(self.batched_leaves(pending))
+                del pending[:]
+            return range(first, first + len(children))
+
+        def fold(node):
+            if isinstance(node, int):
+                return values[node]
+            if len(node) == 1:
+                return node[0]
+            if isinstance(node[1], range):
+                scores = values[node[1].start:node[1].stop]
+            else:
+                scores = [fold(child) for child in node[1]]
+            if not scores:
+                return float('-inf') if node[0] else float('inf')
+            return max(scores) if node[0] else min(scores)
+
+        trees = [self.batched_node(bitboard.to_bits(s), depth, turn, add_leaves) for s in states]
+        values.extend(self.batched_leaves(pending))
+        return [fold(tree) for tree in trees]
+
+    def batched_node(self, bits, depth, turn, add_leaves):
+        """ Expands a node of the batched_values tree. A leaf is the int index of
+        its value, a decided node a 1-tuple of its value, any other node a
+        (maximizing, children) pair, where children is a range of leaf indices
+        just above the leaves. add_leaves(positions) queues depth 0 positions
+        and returns their indices.
+        """
+        self.stats['nodes'] += 1
+        if depth == 0:
+            return add_leaves([bits])[0]
+        s = self.game_value(bits)
+        if s != 0:
+            return (s,)
+        me = self.pieces.index(self.my_piece)
+        if threats.winning_move(bits, turn) is not None:
+            return (1 if turn == me else -1,)
+        children = [bitboard.apply_move(bits, turn, *move)
+                    for move in bitboard.iter_moves(bits[turn], bits[1 - turn])]
+        if depth == 1:
+            self.stats['nodes'] += len(children)
+            return (turn == me, add_leaves(children))
+        return (turn == me, [self.batched_node(child, depth-1, (turn+1)%2, add_leaves)
+                             for child in children])
+
+    def batched_leaves(self, positions):
+        """ batched.leaf_values of depth 0 positions for this player, as a list """
+        import batched # only this search needs numpy
+        return batched.leaf_values(positions, self.pieces.index(self.my_piece),
+                                   self.linear).tolist()
+
+    def search_root(self, state, turn, depth, search='minimax'):
+        """ Scores every successor of state for self.pieces[turn] and returns the
+        best succ() entry. Resets self.stats before searching.
+        """
+        self.stats = {'nodes': 0, 'cutoffs': 0}
+        if search == 'minimax':
+            best = None
+            max_score = float('-inf')
+            for child in self.succ(state, turn):
+                score = self.max_value(child[0], depth, (turn+1)%2)
+                if score > max_score:
+                    max_score = score
+                    best = child
+            self.stats['score'] = max_score
+            return best
+        elif search == 'batched':
+            children = self.succ(state, turn)
+            scores = self.batched_values([child[0] for child in children], depth, (turn+1)%2)
+            best = None
+            max_score = float('-inf')
+            for (child, score) in zip(children, scores):
+                if score > max_score:
+                    max_score = score
+                    best = child
+            self.stats['score'] = max_score
+            return best
+        elif search == 'parallel':
+            if self.parallel is None:
+                self.parallel = parallel.ParallelSearch()
+            return self.parallel.search(self, state, turn, depth)
+        elif search != 'alphabeta':
+            raise ValueError("Unknown search mode: " + str(search))
+
+        self.tt.new_search()
+        me = self.pieces.index(self.my_piece)
+        board = evaluator.IncrementalBoard(state)
+        key = board.key ^ transposition.SIDE[turn] ^ transposition.PERSPECTIVE[me]
+        entry = self.tt.probe(key)
+        alpha = float('-inf')
+        best = None
+        for move in board.successors(turn, self.ordered_moves(board, turn, 0,
+                                                               entry.move if entry else None)):
+            score = self.alpha_beta(board, depth, alpha, float('inf'), (turn+1)%2, 1)
+            if score > alpha:
+                alpha = score
+                best = move
+        self.stats['score'] = alpha
+        self.killers[0] = best
+        self.tt.store(key, depth + 1, alpha, transposition.EXACT, best)
+        return self.succ_entry(state, turn, best)
+
+    def succ_entry(self, state, turn, move):
+        """ Converts a (src, dst) move of bitboard.iter_moves into the
+        [child, (row, col), source] entry succ() would have produced for it.
+        """
+        (src, dst) = move
+        child = bitboard.apply_move(bitboard.to_bits(state), turn, src, dst)
+        return [child, bitboard.SQUARES[dst], 0 if src is None else bitboard.SQUARES[src]]
+
+    def iterative_deepening(self, state, turn, time_limit_ms, max_depth=MAX_DEPTH):
+        """ Runs alpha-beta searches of increasing depth until time_limit_ms passes,
+        a forced win or loss is found, or max_depth is completed.
+
+        An iteration cut off by the deadline is discarded, so the returned succ()
+        entry always comes from the deepest completed iteration. If not even the
+        depth 0 iteration finishes, the first move in search order is returned.
+        self.stats holds the totals over all iterations, the score and depth of
+        the last completed one, and the elapsed time.
+        """
+        start = time.perf_counter()
+        first = self.ordered_moves(evaluator.IncrementalBoard(state), turn, 0)[0]
+        best = self.succ_entry(state, turn, first)
+        totals = {'nodes': 0, 'cutoffs': 0, 'depth': -1, 'score': None}
+        self.deadline = start + time_limit_ms / 1000.0
+        try:
+            for depth in range(max_depth + 1):
+                try:
+                    best = self.search_root(state, turn, depth, 'alphabeta')
+                except SearchTimeout:
+                    break
+                finally:
+                    totals['nodes'] += self.stats['nodes']
+                    totals['cutoffs'] += self.stats['cutoffs']
+                totals['depth'] = depth
+                totals['score'] = self.stats['score']
+                if abs(totals['score']) >= 1:
+                    break
+        finally:
+            self.deadline = float('inf')
+        totals['time_ms'] = (time.perf_counter() - start) * 1000.0
+        self.stats = totals
+        return best
+
+    def ordered_moves(self, board, turn, ply, first=None, static=True):
+        """ Returns the (src, dst) moves of self.pieces[turn] on an
+        evaluator.IncrementalBoard, ordered for alpha-beta: the move given as first
+        (e.g. from the transposition table), then the previous best move at this
+        ply, then wins, then blocks of the opponent's open lines, then the
+        remaining moves by the static heuristic value after the move. Candidates
+        are scored on plain bitboards; the board itself is not touched. With
+        static=False only the first and previous best moves are moved forward,
+        and the moves are generated lazily instead of returned as a list.
+        """
+        mine, theirs = board.bits[turn], board.bits[1 - turn]
+        killer = self.killers.get(ply)
+        if not static:
+            return bitboard.iter_moves_first(mine, theirs, (first, killer))
+
+        blocks = bitboard.threats(theirs, mine)
+        scored = []
+        for move in bitboard.iter_moves(mine, theirs):
+            (src, dst) = move
+            moved = mine | (1 << dst)
+            if src is not None:
+                moved ^= 1 << src
+            scored.append(((move == first,
+                            move == killer,
+                            bitboard.has_won(moved, theirs),
+                            bool(blocks >> dst & 1),
+                            bitboard.heuristic(moved, theirs)), move))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [move for (key, move) in scored]
+
+    def alpha_beta(self, board, depth, alpha, beta, turn, ply=0):
+        """ Minimax value of a position with alpha-beta pruning.
+
+        Args:
+            board (evaluator.IncrementalBoard): the position; moves are made and
+                taken back on it in place, so it is unchanged on return
+            depth (int): plies left to search
+            alpha (float): score this player is already assured of
+            beta (float): score the opponent is already assured of
+            turn (int): index in self.pieces of the side to move
+            ply (int): distance from the root, used for move ordering
+
+        Returns:
+            float: the same value max_value returns when it lies within
+                (alpha, beta), otherwise a bound on it
+
+        Results are shared through self.tt, so positions reached by different
+        move orders, in this search or an earlier one, are only searched once.
+        """
+        self.stats['nodes'] += 1
+        if self.stats['nodes'] & 63 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        me = self.pieces.index(self.my_piece)
+        w = board.winner()
+        if w is not None:
+            return 1 if w == me else -1
+        elif depth == 0:
+            if self.linear is not None:
+                return self.linear_score(board.bits, me)
+            return board.heuristic(me)
+
+        key = board.key ^ transposition.SIDE[turn] ^ transposition.PERSPECTIVE[me]
+        entry = self.tt.probe(key)
+        first = None
+        if entry is not None:
+            first = entry.move
+            if entry.depth >= depth:
+                if entry.bound == transposition.EXACT:
+                    return entry.score
+                elif entry.bound == transposition.LOWER:
+                    alpha = max(alpha, entry.score)
+                else:
+                    beta = min(beta, entry.score)
+                if alpha >= beta:
+                    self.stats['cutoffs'] += 1
+                    return entry.score
+
+        maximizing = turn == me
+        win = threats.winning_move(board.bits, turn)
+        if win is not None:
+            value = 1 if maximizing else -1
+            self.tt.store(key, depth, value, transposition.EXACT, win)
+            return value
+
+        alpha_orig, beta_orig = alpha, beta
+        value = float('-inf') if maximizing else float('inf')
+        best = None
+        # children of a depth 1 node are leaves, and evaluating a leaf costs no
+        # more than scoring it for ordering, so only the cheap hints are used there
+        children = board.successors(turn, self.ordered_moves(board, turn, ply, first,
+                                                             static=depth > 1))
+        for move in children:
+            score = self.alpha_beta(board, depth-1, alpha, beta, (turn+1)%2, ply+1)
+            if maximizing:
+                if score > value:
+                    value = score
+                    best = move
+                    alpha = max(alpha, value)
+            elif score < value:
+                value = score
+                best = move
+                beta = min(beta, value)
+            if alpha >= beta:
+                self.stats['cutoffs'] += 1
+                self.killers[ply] = best
+                children.close() # takes the move back
+                break
+
+        if value <= alpha_orig:
+            bound = transposition.UPPER
+        elif value >= beta_orig:
+            bound = transposition.LOWER
+        else:
+            bound = transposition.EXACT
+        self.tt.store(key, depth, value, bound, best)
+        return value
+
     def game_value(self, state):
         """ Checks the current board status for a win condition
 
         Args:
-        state (list of lists): either the current state of the game as saved in
-            this Teeko2Player object, or a generated successor state.
+        state (list of lists or tuple): either the current state of the game as
+            saved in this Teeko2Player object, a generated successor state, or a
+            (black, red) bitboard pair.
 
         Returns:
             int: 1 if this Teeko2Player wins, -1 if the opponent wins, 0 if no winner
-
-        TODO: complete checks for diagonal and diamond wins
         """
-        # check horizontal wins
-        for row in state:
-            for i in range(2):
-                if row[i] != ' ' and row[i] == row[i+1] == row[i+2] == row[i+3]:
-                    return 1 if row[i]==self.my_piece else -1
-
-        # check vertical wins
-        for col in range(5):
-            for i in range(2):
-                if state[i][col] != ' ' and state[i][col] == state[i+1][col] == state[i+2][col] == state[i+3][col]:
-                    return 1 if state[i][col]==self.my_piece else -1
-
-        # TODO: check \ diagonal wins
-        for row in range(2):
-            for col in range(2):
-                if state[row][col] != ' ' and state[row][col] == state[row+1][col+1] == state[row+2][col+2] == state[row+3][col+3]:
-                    return 1 if state[row][col] == self.my_piece else -1
-                    
-        # TODO: check / diagonal wins
-        for row in range(2):
-            for col in range(4,2,-1):
-                if state[row][col] != ' ' and state[row][col] == state[row+1][col-1] == state[row+2][col-2] == state[row-3][col-3]:
-                    return 1 if state[row][col] == self.my_piece else -1
-                
-        # TODO: check diamond wins
-        for row in range(1,4):
-            for col in range(1,4):
-                if state[row][col] == ' ' and state[row-1][col] != ' ' and state[row-1][col] == state[row][col-1] == state[row][col+1] == state[row+1][col]:
-                    return 1 if state[row][col] == self.my_piece else -1
-
-        return 0 # no winner yet
+        w = bitboard.winner(bitboard.to_bits(state))
+        if w is None:
+            return 0 # no winner yet
+        return 1 if self.pieces[w] == self.my_piece else -1
 
 ############################################################################
 #
@@ -444,7 +631,6 @@ def main():
     turn = 0
 
     # drop phase
-    ai.drop_phase = True
     while piece_count < 8 and ai.game_value(ai.board) == 0:
 
         # get the player or AI's move
@@ -485,7 +671,6 @@ def main():
         turn += 1
         turn %= 2
     
-    ai.drop_phase = False
     # move phase - can't have a winner until all 8 pieces are on the board
     while ai.game_value(ai.board) == 0:
 
@@ -521,14 +706,7 @@ def main():
             """
             Random Automatic Moves
             """
-            possible_moves = []
-            for r in range(5):
-                for c in range(5):
-                    if ai.board[r][c] == ai.opp:
-                        for i in [-1, 0, 1]:
-                            for j in [-1, 0, 1]:
-                                if r+i >= 0 and r+i < 5 and c+j >= 0 and c+j < 5 and ai.board[r+i][c+j] == ' ':
-                                    possible_moves.append([(r+i, c+j), (r, c)])
+            possible_moves = list(ai.legal_moves(ai.board, ai.pieces.index(ai.opp)))
             ai.opponent_move(random.choice(possible_moves))
 
         # update the game variables
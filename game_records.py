@@ -0,0 +1,266 @@
+""" Compact binary game records.
+
+A record file is an 8-byte magic followed by games, each a fixed 3-byte header
+(little-endian number of plies, then the result: 0 black won, 1 red won, 2
+neither) and one byte per ply. Black moves first, and the first eight plies
+are always the drops, four per color, so a ply's byte is read by its index:
+
+    ply < 8     the destination square index, 0..24
+    ply >= 8    source square index * 8 + direction, where direction indexes
+                DIRECTIONS (the step from the source to the destination)
+
+RecordWriter appends games to a file as they finish; iter_games() walks a file
+through mmap and yields one game at a time, undecoded, so scanning a file of
+millions of games keeps only the current one in memory. validate() decodes and
+replays every game through Teeko2Player.opponent_move() and checks the recorded
+result; a corrupt game is counted as invalid and the scan goes on.
+
+Usage:
+    python game_records.py games.tk2 [--generate 1000] [--seed 0]
+
+--generate first appends that many games of random play to the file.
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+from collections import namedtuple
+
+import bitboard
+import game
+
+MAGIC = b'TK2REC\x00\x01'
+_GAME = struct.Struct('<HB')
+DROP_PLIES = 8 # black and red drop four markers each before any marker moves
+NO_RESULT = 2
+
+# (row, col) steps of a move, in the order of the direction numbers
+DIRECTIONS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+GameRecord = namedtuple('GameRecord', ['result', 'data'])
+GameRecord.__doc__ = """ A game as stored, see decode_game().
+
+    result (int): the header's result byte, 0 black won, 1 red won, 2 neither
+    data (bytes): one encoded move per ply, black first
+"""
+
+
+class RecordError(Exception):
+    """ Raised for a malformed record file or a game that does not replay """
+
+
+def encode_move(ply, src, dst):
+    """ The byte storing the (src, dst) move played at ply """
+    if ply < DROP_PLIES:
+        if src is not None:
+            raise RecordError("ply " + str(ply) + " must be a drop")
+        return dst
+    if src is None:
+        raise RecordError("ply " + str(ply) + " must move a marker")
+    (row, col) = bitboard.SQUARES[src]
+    (r, c) = bitboard.SQUARES[dst]
+    try:
+        return src * 8 + DIRECTIONS.index((r - row, c - col))
+    except ValueError:
+        raise RecordError("ply " + str(ply) + " does not move to an adjacent square")
+
+
+def decode_move(ply, byte):
+    """ Inverse of encode_move() """
+    if ply < DROP_PLIES:
+        if byte >= bitboard.SIZE * bitboard.SIZE:
+            raise RecordError("ply " + str(ply) + " drops off the board")
+        return (None, byte)
+    (src, direction) = divmod(byte, 8)
+    if src >= bitboard.SIZE * bitboard.SIZE:
+        raise RecordError("ply " + str(ply) + " moves from off the board")
+    (row, col) = bitboard.SQUARES[src]
+    (r, c) = (row + DIRECTIONS[direction][0], col + DIRECTIONS[direction][1])
+    if not (0 <= r < bitboard.SIZE and 0 <= c < bitboard.SIZE):
+        raise RecordError("ply " + str(ply) + " moves off the board")
+    return (src, r * bitboard.SIZE + c)
+
+
+def decode_game(record):
+    """ Decodes a GameRecord.
+
+    Returns:
+        tuple: (winner, moves), the index of the winner or None if neither
+            color won, and the (src, dst) moves as yielded by bitboard.iter_moves
+
+    Raises:
+        RecordError: for an unknown result or a move byte off the board
+    """
+    if record.result > NO_RESULT:
+        raise RecordError("unknown result " + str(record.result))
+    moves = [decode_move(ply, byte) for (ply, byte) in enumerate(record.data)]
+    return (None if record.result == NO_RESULT else record.result, moves)
+
+
+def encode_game(moves, winner):
+    """ The header and move bytes of one game """
+    body = bytes(encode_move(ply, src, dst) for (ply, (src, dst)) in enumerate(moves))
+    return _GAME.pack(len(body), NO_RESULT if winner is None else winner) + body
+
+
+class RecordWriter:
+    """ Appends games to a record file, creating it if needed.
+
+    Args:
+        path (str): the record file
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'ab+')
+        self.games = 0
+        self.file.seek(0)
+        head = self.file.read(len(MAGIC))
+        if not head:
+            self.file.write(MAGIC)
+        elif head != MAGIC:
+            self.file.close()
+            raise RecordError(path + " is not a Teeko2 game record file")
+
+    def write(self, moves, winner):
+        """ Appends one game: its (src, dst) moves and the index of the winner,
+        or None if neither color won.
+        """
+        self.file.write(encode_game(moves, winner))
+        self.games += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_games(path):
+    """ Lazily yields the GameRecord of every game in a record file. Only the
+    framing is checked here; the games are decoded by decode_game().
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < len(MAGIC):
+            raise RecordError(path + " is not a Teeko2 game record file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise RecordError(path + " is not a Teeko2 game record file")
+            offset = len(MAGIC)
+            end = len(data)
+            while offset < end:
+                if offset + _GAME.size > end:
+                    raise RecordError(path + " ends inside a game header")
+                (plies, result) = _GAME.unpack_from(data, offset)
+                offset += _GAME.size
+                if offset + plies > end:
+                    raise RecordError(path + " ends inside a game")
+                yield GameRecord(result, data[offset:offset + plies])
+                offset += plies
+
+
+def replay(record, player=None):
+    """ Decodes a GameRecord and plays it on player (a fresh Teeko2Player if
+    None) with every move validated and applied by opponent_move(), and checks
+    the recorded result: a completed line or diamond, or a side left with no
+    legal move.
+
+    Returns:
+        tuple: the final (black, red) position
+
+    Raises:
+        RecordError: if the game does not decode, a move is illegal, a move
+            follows the end of the game, or the result does not match the final
+            position
+    """
+    (winner, moves) = decode_game(record)
+    if player is None:
+        player = game.Teeko2Player()
+    player.position = (0, 0)
+    w = None
+    for (ply, (src, dst)) in enumerate(moves):
+        if w is not None:
+            raise RecordError("ply " + str(ply) + " is played after the game ended")
+        turn = ply % 2
+        position = player.position
+        # opponent_move checks squares and adjacency but not whose phase it is
+        if not bitboard.is_legal(position[turn], position[1 - turn], src, dst):
+            raise RecordError("ply " + str(ply) + " is illegal")
+        player.opp = player.pieces[turn]
+        player.my_piece = player.pieces[1 - turn]
+        player.opponent_move(bitboard.to_move_list(src, dst))
+        w = bitboard.winner(player.position)
+    position = player.position
+    if w is None and winner is not None:
+        turn = len(moves) % 2
+        stuck = next(bitboard.iter_moves(position[turn], position[1 - turn]), None) is None
+        if not (stuck and winner == 1 - turn):
+            raise RecordError("recorded winner " + str(winner) + " has not won")
+    elif w != winner:
+        raise RecordError("recorded result " + str(winner) + " but " + str(w) + " won")
+    return position
+
+
+def validate(path, max_errors=20):
+    """ Replays every game of a record file.
+
+    Returns:
+        dict: 'games', 'valid' and 'invalid' counts, and 'errors', up to
+            max_errors (game index, message) pairs
+    """
+    player = game.Teeko2Player()
+    summary = {'games': 0, 'valid': 0, 'invalid': 0, 'errors': []}
+    for (index, record) in enumerate(iter_games(path)):
+        summary['games'] += 1
+        try:
+            replay(record, player)
+        except RecordError as e:
+            summary['invalid'] += 1
+            if len(summary['errors']) < max_errors:
+                summary['errors'].append((index, str(e)))
+        else:
+            summary['valid'] += 1
+    return summary
+
+
+def random_game(rng, max_plies=200):
+    """ (moves, winner) of a game of uniformly random legal moves """
+    bits = (0, 0)
+    moves = []
+    for ply in range(max_plies):
+        turn = ply % 2
+        legal = list(bitboard.iter_moves(bits[turn], bits[1 - turn]))
+        if not legal:
+            return (moves, 1 - turn)
+        move = rng.choice(legal)
+        moves.append(move)
+        bits = bitboard.apply_move(bits, turn, *move)
+        w = bitboard.winner(bits)
+        if w is not None:
+            return (moves, w)
+    return (moves, None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate a Teeko2 game record file")
+    parser.add_argument('path')
+    parser.add_argument('--generate', type=int, default=0,
+                        help="first append this many random games to the file")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.generate:
+        rng = random.Random(args.seed)
+        with RecordWriter(args.path) as writer:
+            for n in range(args.generate):
+                writer.write(*random_game(rng))
+    start = time.perf_counter()
+    summary = validate(args.path)
+    seconds = time.perf_counter() - start
+    print(summary['games'], 'games,', summary['valid'], 'valid,', summary['invalid'], 'invalid,',
+          round(summary['games'] / seconds) if seconds > 0 else 0, 'games/s')
+    for (index, message) in summary['errors']:
+        print('game', index, message)
@@ -0,0 +1,316 @@
+""" Opt-in search instrumentation and a profiling entry point.
+
+Instrumentation.attach() shadows a Teeko2Player's search methods with counting
+wrappers stored on the instance; detach() deletes them again. A player that
+was never attached runs the plain class methods, so the search carries no
+instrumentation cost at all unless it is switched on.
+
+While attached, every make_move() appends a record with the move, its time,
+move generations, nodes per remaining depth, leaf evaluations, terminal
+positions, transposition table and evaluation cache hits, cutoffs, the
+principal variation and the time spent searching it. The alpha-beta searches
+read the principal variation from the transposition table; a minimax search
+has none, so the max_value wrapper keeps the best line below every node it
+visits. Batched, parallel and MCTS searches record it as null.
+
+Usage:
+    python instrument.py [--positions 20] [--depth 2] [--search alphabeta]
+        [--records moves.jsonl] [--profile search.prof]
+
+--profile runs the canned positions under cProfile and saves the stats, which
+pstats, snakeviz or flameprof can read; py-spy can also record the same run.
+"""
+import argparse
+import cProfile
+import json
+import pstats
+import time
+
+import benchmark
+import bitboard
+import game
+import threats
+import transposition
+
+# methods shadowed on an attached player
+HOOKS = ('make_move', 'search_root', 'succ', 'ordered_moves', 'max_value', 'alpha_beta',
+         'batched_node', 'batched_leaves', 'game_value', 'heuristic_game_value')
+
+
+class Instrumentation:
+    """ Counters and per-move records for one Teeko2Player.
+
+    Args:
+        player (Teeko2Player): the player to watch
+        on_record (callable): called with each record as it is made
+    """
+
+    def __init__(self, player, on_record=None):
+        self.player = player
+        self.on_record = on_record
+        self.records = []
+        self.attached = False
+        self.reset()
+
+    def reset(self):
+        """ Zeroes the counters of the current move """
+        self.counters = {'succ': 0, 'nodes_by_depth': {}, 'leaf_evals': 0, 'terminal': 0}
+        self.level = 0 # nesting of max_value/alpha_beta calls below the root
+        self.root_calls = [] # (score, ms, line) of each root move of the last iteration
+        self.frames = [] # [bits, maximizing, best score, best line] of open max_value calls
+
+    def attach(self):
+        if self.attached:
+            return self
+        original = {name: getattr(self.player, name) for name in HOOKS}
+        for name in HOOKS:
+            wrapper = getattr(self, '_' + name)
+            self.player.__dict__[name] = _bind(wrapper, original[name])
+        self.attached = True
+        return self
+
+    def detach(self):
+        for name in HOOKS:
+            self.player.__dict__.pop(name, None)
+        self.attached = False
+
+    def __enter__(self):
+        return self.attach()
+
+    def __exit__(self, *exc):
+        self.detach()
+
+    def export(self, path):
+        """ Writes the records to path, one JSON object per line """
+        write_records(self.records, path)
+
+    ########################################################################
+    # wrappers: each gets the original bound method first
+
+    def _make_move(self, make_move, state, depth=1, search='minimax', time_limit_ms=None):
+        player = self.player
+        self.reset()
+        tt_stats = dict(player.tt.stats)
+        cache_hits = player.eval_cache.stats['hits'] if player.eval_cache is not None else 0
+        start = time.perf_counter()
+        move = make_move(state, depth, search, time_limit_ms)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        stats = player.stats
+        score = stats.get('score')
+        # search_root keeps the first root move with the best score
+        root = next(((ms, line) for (s, ms, line) in self.root_calls if s == score), None)
+        # make_move only runs iterative deepening for the alpha-beta searches
+        mode = 'iterative' if time_limit_ms is not None and search != 'mcts' else search
+        if mode in ('alphabeta', 'iterative'):
+            pv = principal_variation(player, state, depth if time_limit_ms is None
+                                     else stats.get('depth', 0))
+            if pv[:1] != [move]: # a move played without searching
+                pv = [move]
+        elif mode == 'minimax':
+            pv = [move] + (root[1] if root is not None else [])
+        else:
+            pv = None
+        c = self.counters
+        record = {
+            'color': player.my_piece,
+            'move': move,
+            'search': mode,
+            'ms': elapsed,
+            'depth': stats.get('depth', depth),
+            'score': score,
+            'nodes': stats.get('nodes', 0),
+            'nodes_by_depth': {str(d): n for (d, n) in sorted(c['nodes_by_depth'].items())},
+            'succ_calls': c['succ'],
+            'leaf_evals': c['leaf_evals'],
+            'terminal': c['terminal'],
+            'cutoffs': stats.get('cutoffs', 0),
+            'tt_probes': player.tt.stats['probes'] - tt_stats['probes'],
+            'tt_hits': player.tt.stats['hits'] - tt_stats['hits'],
+            'eval_cache_hits': (player.eval_cache.stats['hits'] - cache_hits
+                                if player.eval_cache is not None else 0),
+            'pv': pv,
+            'pv_ms': root[0] if root is not None else None,
+        }
+        self.records.append(record)
+        if self.on_record is not None:
+            self.on_record(record)
+        return move
+
+    def _search_root(self, search_root, state, turn, depth, search='minimax'):
+        calls = []
+        saved = self.root_calls
+        self.root_calls = calls
+        try:
+            return search_root(state, turn, depth, search)
+        except BaseException:
+            self.root_calls = saved # keep the last completed iteration
+            raise
+
+    def _succ(self, succ, state, turn=0):
+        self.counters['succ'] += 1
+        return succ(state, turn)
+
+    def _ordered_moves(self, ordered_moves, board, turn, ply, first=None, static=True):
+        self.counters['succ'] += 1
+        return ordered_moves(board, turn, ply, first, static)
+
+    def _node(self, search, depth, args, frame=None):
+        by_depth = self.counters['nodes_by_depth']
+        by_depth[depth] = by_depth.get(depth, 0) + 1
+        if self.level:
+            self.level += 1
+            try:
+                return search(*args)
+            finally:
+                self.level -= 1
+        self.level = 1
+        start = time.perf_counter()
+        try:
+            score = search(*args)
+        finally:
+            self.level = 0
+        line = frame[3] if frame is not None else None
+        self.root_calls.append((score, (time.perf_counter() - start) * 1000.0, line))
+        return score
+
+    def _max_value(self, max_value, state, depth, turn):
+        bits = bitboard.to_bits(state)
+        if (depth > 0 and bitboard.winner(bits) is None
+                and threats.winning_move(bits, turn) is None):
+            self.counters['succ'] += 1 # max_value expands it with iter_children
+        frame = [bits, turn == self.player.pieces.index(self.player.my_piece), None, []]
+        self.frames.append(frame)
+        try:
+            score = self._node(max_value, depth, (state, depth, turn), frame)
+        finally:
+            self.frames.pop()
+        if self.frames:
+            parent = self.frames[-1]
+            if parent[2] is None or (score > parent[2] if parent[1] else score < parent[2]):
+                mover = 1 - turn
+                src = parent[0][mover] & ~bits[mover]
+                dst = bits[mover] & ~parent[0][mover]
+                move = bitboard.to_move_list(src.bit_length() - 1 if src else None,
+                                             dst.bit_length() - 1)
+                parent[2] = score
+                parent[3] = [move] + frame[3]
+        return score
+
+    def _alpha_beta(self, alpha_beta, board, depth, alpha, beta, turn, ply=0):
+        if board.winner() is not None:
+            self.counters['terminal'] += 1
+        elif depth == 0:
+            self.counters['leaf_evals'] += 1
+        return self._node(alpha_beta, depth, (board, depth, alpha, beta, turn, ply))
+
+    def _batched_node(self, batched_node, bits, depth, turn, add_leaves):
+        if depth == 0: # counted when batched_leaves scores it
+            return batched_node(bits, depth, turn, add_leaves)
+        by_depth = self.counters['nodes_by_depth']
+        by_depth[depth] = by_depth.get(depth, 0) + 1
+        node = batched_node(bits, depth, turn, add_leaves)
+        if len(node) == 2:
+            self.counters['succ'] += 1
+        return node
+
+    def _batched_leaves(self, batched_leaves, positions):
+        by_depth = self.counters['nodes_by_depth']
+        by_depth[0] = by_depth.get(0, 0) + len(positions)
+        won = sum(1 for bits in positions if bitboard.winner(bits) is not None)
+        self.counters['terminal'] += won
+        self.counters['leaf_evals'] += len(positions) - won
+        return batched_leaves(positions)
+
+    def _game_value(self, game_value, state):
+        value = game_value(state)
+        if value != 0:
+            self.counters['terminal'] += 1
+        return value
+
+    def _heuristic_game_value(self, heuristic_game_value, state, piece):
+        self.counters['leaf_evals'] += 1
+        return heuristic_game_value(state, piece)
+
+
+def _bind(wrapper, original):
+    def hook(*args, **kwargs):
+        return wrapper(original, *args, **kwargs)
+    hook.__name__ = original.__name__
+    return hook
+
+
+def write_records(records, path):
+    """ Writes records to path, one JSON object per line """
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def principal_variation(player, state, depth):
+    """ Follows the best moves stored in player.tt from state, with player to
+    move, for at most depth + 1 plies. Returns them in make_move format.
+    """
+    me = player.pieces.index(player.my_piece)
+    bits = bitboard.to_bits(state)
+    turn = me
+    pv = []
+    for ply in range(depth + 1):
+        if bitboard.winner(bits) is not None:
+            break
+        key = transposition.zobrist(bits, turn, me)
+        entry = player.tt.slots[key % player.tt.max_entries]
+        if entry is None or entry.key != key or entry.move is None:
+            break
+        if entry.move not in bitboard.iter_moves(bits[turn], bits[1 - turn]):
+            break
+        pv.append(bitboard.to_move_list(*entry.move))
+        bits = bitboard.apply_move(bits, turn, *entry.move)
+        turn = 1 - turn
+    return pv
+
+
+def run_canned(positions, depth=2, search='alphabeta', time_limit_ms=None, instrumented=True):
+    """ Plays make_move on each (bits, turn) position, e.g. from
+    benchmark.sample_positions, with a fresh player that has no opening book or
+    tablebase. Returns the per-move records, empty unless instrumented.
+    """
+    records = []
+    for (bits, turn) in positions:
+        player = game.Teeko2Player()
+        player.my_piece = player.pieces[turn]
+        player.opp = player.pieces[1 - turn]
+        player.book = None
+        player.tablebase = None
+        if instrumented:
+            with Instrumentation(player, records.append):
+                player.make_move(bits, depth, search, time_limit_ms)
+        else:
+            player.make_move(bits, depth, search, time_limit_ms)
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Instrument or profile Teeko2Player searches")
+    parser.add_argument('--positions', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--search', default='alphabeta')
+    parser.add_argument('--time-limit-ms', type=float, default=None)
+    parser.add_argument('--records', default=None, help="write per-move records as JSON lines")
+    parser.add_argument('--profile', default=None,
+                        help="run uninstrumented under cProfile and save the stats here")
+    args = parser.parse_args()
+    positions = benchmark.sample_positions(args.positions, args.seed)
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.runcall(run_canned, positions, args.depth, args.search, args.time_limit_ms,
+                         instrumented=False)
+        profiler.dump_stats(args.profile)
+        pstats.Stats(args.profile).sort_stats('cumulative').print_stats(15)
+    else:
+        records = run_canned(positions, args.depth, args.search, args.time_limit_ms)
+        if args.records:
+            write_records(records, args.records)
+        for record in records:
+            print(record['move'], round(record['ms'], 2), 'ms', record['nodes'], 'nodes',
+                  'pv', record['pv'])
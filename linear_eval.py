@@ -0,0 +1,156 @@
+""" Linear position evaluator with weights fitted from self-play (see tuning.py).
+
+A position is described from one color's point of view by the number of open
+lines it holds minus the number the opponent holds, counted separately for
+four-in-a-row lines and diamond rings with one, two or three markers. A line
+is open for a color when the opponent has no marker on it (and, for a diamond,
+its center is empty). The score is SCALE * tanh(w . x / 2), i.e. the win
+probability of a logistic model mapped onto (-SCALE, SCALE), so it always
+stays below the 1 of a won game.
+
+The lines a color touches depend only on its own bitboard and are memoized
+per bitboard, like the profiles in bitboard.py; weights are saved as a small
+JSON file that LinearEvaluator reads when it is created.
+
+feature_matrix() computes the same features for a whole batch of positions
+with NumPy (optional, as in batched.py).
+"""
+import json
+import math
+import os
+
+import bitboard
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'teeko2_weights.json')
+FEATURES = ('line1', 'line2', 'line3', 'diamond1', 'diamond2', 'diamond3')
+SCALE = 0.9 # largest magnitude of a score, so a won game always scores higher
+
+# every line scored: (mask, center, first feature), center 0 for straight lines
+_LINES = ([(m, 0, 0) for m in bitboard.WIN_LINES] +
+          [(ring, center, 3) for (ring, center) in bitboard.DIAMONDS])
+
+# per-color touched lines: (mask, center, feature) for every line holding one
+# to three markers of the color
+_touched = {}
+
+
+def _touched_lines(mine):
+    count = bitboard.popcount
+    profile = tuple((m, center, first + count(mine & m) - 1) for (m, center, first) in _LINES
+                    if 0 < count(mine & m) < 4)
+    _touched[mine] = profile
+    return profile
+
+
+def _open_counts(mine, theirs, x, sign):
+    """ Adds sign to x[feature] for every line open for `mine` """
+    try:
+        profile = _touched[mine]
+    except KeyError:
+        profile = _touched_lines(mine)
+    occupied = mine | theirs
+    for (m, center, f) in profile:
+        if not theirs & m and not occupied & center:
+            x[f] += sign
+
+
+def features(bits, me):
+    """ Feature vector (a list in FEATURES order) of a (black, red) pair from
+    the point of view of color index me.
+    """
+    x = [0] * len(FEATURES)
+    _open_counts(bits[me], bits[1 - me], x, 1)
+    _open_counts(bits[1 - me], bits[me], x, -1)
+    return x
+
+
+def feature_matrix(positions, me):
+    """ features() of every (black, red) pair in positions as an (n, features)
+    float array. Needs numpy.
+    """
+    if np is None:
+        raise ImportError("feature_matrix needs numpy (pip install numpy)")
+    if len(positions) == 0:
+        return np.zeros((0, len(FEATURES)))
+    masks = np.array([[m >> i & 1 for i in range(bitboard.SIZE * bitboard.SIZE)]
+                      for (m, center, first) in _LINES], dtype=np.float32)
+    centers = np.array([center for (m, center, first) in _LINES], dtype=np.int64)
+    firsts = np.array([first for (m, center, first) in _LINES])
+    bits = np.array(positions, dtype=np.int64).reshape(-1, 2)
+    squares = (bits[:, :, None] >> np.arange(bitboard.SIZE * bitboard.SIZE)) & 1
+    counts = squares.astype(np.float32) @ masks.T # (n, 2, lines)
+    center_free = ((bits[:, 0:1] | bits[:, 1:2]) & centers) == 0 # (n, lines)
+    x = np.zeros((len(bits), len(FEATURES)))
+    for (color, sign) in ((me, 1), (1 - me, -1)):
+        mine, theirs = counts[:, color], counts[:, 1 - color]
+        open_lines = (theirs == 0) & center_free
+        for k in (1, 2, 3):
+            hits = open_lines & (mine == k)
+            for first in (0, 3):
+                x[:, first + k - 1] += sign * hits[:, firsts == first].sum(axis=1)
+    return x
+
+
+def save(weights, path=DEFAULT_PATH):
+    """ Writes a weight per feature to path as JSON """
+    if len(weights) != len(FEATURES):
+        raise ValueError("expected " + str(len(FEATURES)) + " weights")
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'features': list(FEATURES), 'weights': [float(w) for w in weights]}, f,
+                  indent=2)
+    os.replace(tmp, path)
+
+
+def load(path=DEFAULT_PATH):
+    """ Reads weights written by save() """
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('features') != list(FEATURES):
+        raise ValueError(path + " holds weights for other features")
+    return tuple(data['weights'])
+
+
+class LinearEvaluator:
+    """ Scores positions with fitted weights.
+
+    Args:
+        path (str): weights file to load
+        weights (sequence): weights to use instead of loading a file
+    """
+
+    def __init__(self, path=DEFAULT_PATH, weights=None):
+        self.weights = tuple(weights) if weights is not None else load(path)
+        if len(self.weights) != len(FEATURES):
+            raise ValueError("expected " + str(len(FEATURES)) + " weights")
+
+    def score(self, bits, me):
+        """ Static score in (-SCALE, SCALE) of an undecided position for color
+        index me; takes the place of bitboard.heuristic(bits[me], bits[1 - me]).
+
+        The weights are summed over integer feature counts in FEATURES order,
+        so the score is exactly the same for every symmetric image of a
+        position and exactly negated for the other color, which lets
+        eval_cache.EvalCache store it once per symmetry class.
+        """
+        z = 0.0
+        for (w, n) in zip(self.weights, features(bits, me)):
+            z += w * n
+        return SCALE * math.tanh(z / 2)
+
+    def scores(self, positions, me):
+        """ score() of every position as a NumPy array, equal to it bit for bit:
+        the weights are summed in the same order, and math.tanh() is applied to
+        each distinct sum, since np.tanh() rounds differently.
+        """
+        x = feature_matrix(positions, me)
+        z = np.zeros(len(x))
+        for (f, w) in enumerate(self.weights):
+            z += w * x[:, f]
+        (sums, inverse) = np.unique(z, return_inverse=True)
+        return SCALE * np.array([math.tanh(v / 2) for v in sums], dtype=float)[inverse]
@@ -0,0 +1,319 @@
+""" Monte Carlo tree search (UCT) engine for Teeko2Player.
+
+The tree lives in a NodePool: parallel typed arrays indexed by node number,
+with the children of a node allocated next to each other, so a node costs a
+few dozen bytes and the pool never grows past max_nodes. A node whose children
+do not fit is simply not expanded any further; playouts from it still count.
+
+Each iteration walks down the tree by UCB1, expands the leaf it reaches,
+plays random moves from there (taking any immediate win) until someone wins
+or a ply limit is hit, which counts as a draw, and backs the result up the
+path. The move played is the most visited root child. Between calls the
+subtree under the position actually reached is kept and compacted into a
+fresh pool, so the statistics gathered for the opponent's reply are reused.
+
+With workers > 1 independent trees are searched in worker processes on the
+same position (root parallelization) and their root visit counts summed.
+
+Usage (compare against minimax in a tournament):
+    python mcts.py [--games 10] [--iterations 2000] [--depth 1] [--workers 1]
+"""
+import argparse
+import math
+import random
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import bitboard
+
+UCT_C = math.sqrt(2) # exploration constant
+MAX_PLAYOUT_PLIES = 100 # a playout still undecided after this many plies is a draw
+
+
+def _pack_move(src, dst):
+    return dst if src is None else (src + 1) * 32 + dst
+
+
+def _unpack_move(packed):
+    return (None, packed) if packed < 32 else (packed // 32 - 1, packed % 32)
+
+
+class NodePool:
+    """ Fixed-capacity store of search tree nodes.
+
+    Attributes:
+        bits, turn: packed position (bitboard.pack) and index of the side to move
+        move: packed (src, dst) move that led to the node
+        parent, first, count: tree links; first is -1 until the node is expanded
+        visits, wins: playouts through the node and their score for the side
+            that made `move` (1 per win, 0.5 per draw)
+        winner: bitboard.winner() of the position, -1 for none
+    """
+    FIELDS = (('bits', 'q'), ('turn', 'b'), ('move', 'h'), ('parent', 'i'), ('first', 'i'),
+              ('count', 'b'), ('visits', 'i'), ('wins', 'd'), ('winner', 'b'))
+
+    def __init__(self, max_nodes):
+        self.max_nodes = max_nodes
+        self.clear()
+
+    def clear(self):
+        for (name, code) in self.FIELDS:
+            setattr(self, name, array(code))
+
+    def __len__(self):
+        return len(self.bits)
+
+    def add(self, bits, turn, move, parent):
+        """ Appends an unexpanded node for the (black, red) pair bits and returns
+        its index.
+        """
+        w = bitboard.winner(bits)
+        self.bits.append(bitboard.pack(bits))
+        self.turn.append(turn)
+        self.move.append(move)
+        self.parent.append(parent)
+        self.first.append(-1)
+        self.count.append(0)
+        self.visits.append(0)
+        self.wins.append(0.0)
+        self.winner.append(-1 if w is None else w)
+        return len(self.bits) - 1
+
+    def subtree(self, root):
+        """ Returns a new pool holding the subtree under root, with root as node 0 """
+        pool = NodePool(self.max_nodes)
+        (old, new) = ([root], [0])
+        for (name, code) in self.FIELDS:
+            getattr(pool, name).append(getattr(self, name)[root])
+        pool.parent[0] = -1
+        i = 0
+        while i < len(old):
+            (node, copy) = (old[i], new[i])
+            i += 1
+            if self.first[node] < 0:
+                continue
+            pool.first[copy] = len(pool)
+            for child in range(self.first[node], self.first[node] + self.count[node]):
+                for (name, code) in self.FIELDS:
+                    getattr(pool, name).append(getattr(self, name)[child])
+                pool.parent[-1] = copy
+                old.append(child)
+                new.append(len(pool) - 1)
+        return pool
+
+
+class MCTS:
+    """ UCT search with tree reuse between moves.
+
+    Args:
+        iterations (int): playouts per move, or None to rely on the time limit
+        time_limit_ms (float): default time budget per move, or None
+        max_nodes (int): capacity of the node pool
+        workers (int): processes searching independent trees; 1 searches here
+        seed: seed of the playout random number generator
+        c (float): exploration constant
+    """
+
+    def __init__(self, iterations=2000, time_limit_ms=None, max_nodes=1 << 17, workers=1,
+                 seed=None, c=UCT_C):
+        if iterations is None and time_limit_ms is None:
+            raise ValueError("MCTS needs an iteration or a time budget")
+        self.iterations = iterations
+        self.time_limit_ms = time_limit_ms
+        self.max_nodes = max_nodes
+        self.workers = workers
+        self.c = c
+        self.rng = random.Random(seed)
+        self.pool = NodePool(max_nodes)
+        self.stats = {}
+        self.executor = None
+
+    def search(self, state, turn, time_limit_ms=None, iterations=None):
+        """ Returns the (src, dst) move to play for pieces[turn] in state, leaving
+        playouts, tree size, reused visits and the move's win rate in self.stats.
+        """
+        bits = bitboard.to_bits(state)
+        iterations = self.iterations if iterations is None else iterations
+        time_limit_ms = self.time_limit_ms if time_limit_ms is None else time_limit_ms
+        if self.workers > 1:
+            return self._search_parallel(bits, turn, iterations, time_limit_ms)
+        start = time.perf_counter()
+        reused = self._reroot(bits, turn)
+        deadline = float('inf') if time_limit_ms is None else start + time_limit_ms / 1000.0
+        pool = self.pool
+        if pool.first[0] < 0:
+            self._expand(0)
+        if not pool.count[0]:
+            raise ValueError("no legal moves to search")
+        n = 0
+        while iterations is None or n < iterations:
+            if n & 63 == 0 and time.perf_counter() > deadline:
+                break
+            self._iterate()
+            n += 1
+        best = max(range(pool.first[0], pool.first[0] + pool.count[0]),
+                   key=lambda child: pool.visits[child])
+        self.stats = {'nodes': n, 'playouts': n, 'tree_nodes': len(pool), 'reused': reused,
+                      'score': pool.wins[best] / pool.visits[best] if pool.visits[best] else None,
+                      'time_ms': (time.perf_counter() - start) * 1000.0}
+        return _unpack_move(pool.move[best])
+
+    def root_visits(self):
+        """ {(src, dst): visits} of the root's children """
+        pool = self.pool
+        return {_unpack_move(pool.move[child]): pool.visits[child]
+                for child in range(pool.first[0], pool.first[0] + pool.count[0])}
+
+    def _reroot(self, bits, turn):
+        """ Makes the node for (bits, turn) the root, keeping its subtree if it is
+        within two plies of the current root. Returns the visits kept.
+        """
+        pool = self.pool
+        packed = bitboard.pack(bits)
+        if len(pool):
+            frontier = [0]
+            for ply in range(3):
+                for node in frontier:
+                    if pool.bits[node] == packed and pool.turn[node] == turn:
+                        if node != 0:
+                            self.pool = pool.subtree(node)
+                        return self.pool.visits[0]
+                frontier = [child for node in frontier if pool.first[node] >= 0
+                            for child in range(pool.first[node],
+                                               pool.first[node] + pool.count[node])]
+        pool.clear()
+        pool.add(bits, turn, 0, -1)
+        return 0
+
+    def _expand(self, node):
+        """ Adds the children of node if they fit in the pool """
+        pool = self.pool
+        bits = bitboard.unpack(pool.bits[node])
+        turn = pool.turn[node]
+        moves = list(bitboard.iter_moves(bits[turn], bits[1 - turn]))
+        if len(pool) + len(moves) > pool.max_nodes:
+            return False
+        pool.first[node] = len(pool)
+        pool.count[node] = len(moves)
+        for (src, dst) in moves:
+            pool.add(bitboard.apply_move(bits, turn, src, dst), 1 - turn, _pack_move(src, dst), node)
+        return True
+
+    def _iterate(self):
+        pool = self.pool
+        first, count, visits, wins = pool.first, pool.count, pool.visits, pool.wins
+        c = self.c
+        node = 0
+        # selection
+        while first[node] >= 0 and pool.winner[node] < 0 and count[node]:
+            log_n = math.log(visits[node] or 1)
+            best = -1
+            best_value = -1.0
+            for child in range(first[node], first[node] + count[node]):
+                n = visits[child]
+                if n == 0:
+                    best = child
+                    break
+                value = wins[child] / n + c * math.sqrt(log_n / n)
+                if value > best_value:
+                    best_value = value
+                    best = child
+            node = best
+        # expansion, once a leaf has been visited
+        if pool.winner[node] < 0 and visits[node] and self._expand(node) and count[node]:
+            node = first[node] + self.rng.randrange(count[node])
+        # simulation
+        if pool.winner[node] >= 0:
+            result = pool.winner[node]
+        elif first[node] >= 0 and not count[node]:
+            result = 1 - pool.turn[node] # the side to move is stuck
+        else:
+            result = playout(bitboard.unpack(pool.bits[node]), pool.turn[node], self.rng)
+        # backpropagation
+        while node >= 0:
+            visits[node] += 1
+            mover = 1 - pool.turn[node]
+            if result is None:
+                wins[node] += 0.5
+            elif result == mover:
+                wins[node] += 1.0
+            node = pool.parent[node]
+
+    def _search_parallel(self, bits, turn, iterations, time_limit_ms):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        start = time.perf_counter()
+        share = None if iterations is None else -(-iterations // self.workers)
+        tasks = [(bitboard.pack(bits), turn, share, time_limit_ms, self.max_nodes // self.workers,
+                  self.rng.getrandbits(32), self.c) for i in range(self.workers)]
+        visits = {}
+        playouts = 0
+        for (counts, n) in self.executor.map(_search_task, tasks):
+            playouts += n
+            for (move, v) in counts.items():
+                visits[move] = visits.get(move, 0) + v
+        best = max(visits, key=visits.get)
+        self.stats = {'nodes': playouts, 'playouts': playouts, 'tree_nodes': None, 'reused': 0,
+                      'score': None, 'time_ms': (time.perf_counter() - start) * 1000.0}
+        return best
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+def _search_task(task):
+    """ Searches one independent tree in a worker: returns (root visits, playouts) """
+    (packed, turn, iterations, time_limit_ms, max_nodes, seed, c) = task
+    engine = MCTS(iterations, time_limit_ms, max_nodes, seed=seed, c=c)
+    engine.search(bitboard.unpack(packed), turn)
+    return (engine.root_visits(), engine.stats['playouts'])
+
+
+def playout(bits, turn, rng, max_plies=MAX_PLAYOUT_PLIES):
+    """ Plays random moves from (bits, turn), except that a move winning on the
+    spot is always taken, and returns the index of the winner, or None if
+    nobody has won after max_plies plies. A side with no legal move loses.
+    """
+    iter_moves = bitboard.iter_moves
+    has_won = bitboard.has_won
+    for ply in range(max_plies):
+        mine, theirs = bits[turn], bits[1 - turn]
+        moves = []
+        for (src, dst) in iter_moves(mine, theirs):
+            moved = mine | (1 << dst)
+            if src is not None:
+                moved ^= 1 << src
+            if has_won(moved, theirs):
+                return turn
+            moves.append(moved)
+        if not moves:
+            return 1 - turn
+        mine = moves[rng.randrange(len(moves))]
+        # moving a marker off a diamond center can complete the opponent's diamond
+        if has_won(theirs, mine):
+            return 1 - turn
+        bits = (mine, theirs) if turn == 0 else (theirs, mine)
+        turn = 1 - turn
+    return None
+
+
+if __name__ == "__main__":
+    import tournament
+    parser = argparse.ArgumentParser(description="Play MCTS against minimax")
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=2000, help="MCTS playouts per move")
+    parser.add_argument('--depth', type=int, default=1, help="minimax search depth")
+    parser.add_argument('--workers', type=int, default=1, help="processes playing games")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    configs = [tournament.PlayerConfig('mcts', search='mcts', iterations=args.iterations),
+               tournament.PlayerConfig('minimax', depth=args.depth, search='minimax')]
+    summary = tournament.summarize(tournament.run_tournament(configs, args.games, args.workers,
+                                                             args.seed))
+    for name, s in summary.items():
+        rate = 'playouts/s' if name == 'mcts' else 'nodes/s'
+        print(name.ljust(8), 'win rate', round(s['win_rate'], 3), ' ', round(s['nodes_per_sec']),
+              rate, ' p50', round(s['latency_p50_ms'], 1), 'ms')
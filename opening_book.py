@@ -0,0 +1,144 @@
+""" Drop phase opening book for Teeko2Player.
+
+The book maps drop phase positions to the square to drop on. Positions are
+stored once per symmetry class, keyed by bitboard.canonical(), and the stored
+move is mapped back through the inverse symmetry on lookup. The side to move
+is implied by the marker counts (black drops first).
+
+The file is a header (magic, entry count) followed by fixed-size entries of
+packed canonical position and destination square, sorted by position.
+
+Usage:
+    python opening_book.py [--path teeko2_openings.book] [--plies 4] [--depth 3]
+"""
+import argparse
+import os
+import struct
+
+import bitboard
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'teeko2_openings.book')
+MAGIC = b'TK2BOOK\x01'
+_COUNT = struct.Struct('<I')
+_ENTRY = struct.Struct('<QB')
+
+
+def side_to_move(bits):
+    """ Index of the color to drop next """
+    return 0 if bitboard.popcount(bits[0]) == bitboard.popcount(bits[1]) else 1
+
+
+def drop_positions(plies):
+    """ Returns the canonical positions with fewer than `plies` markers that can
+    arise in the drop phase, in order of marker count.
+    """
+    layer = {bitboard.canonical((0, 0))[0]}
+    positions = []
+    for n in range(min(plies, 8)):
+        positions.extend(sorted(layer, key=bitboard.pack))
+        following = set()
+        for bits in layer:
+            if bitboard.winner(bits) is not None:
+                continue
+            turn = side_to_move(bits)
+            for move in bitboard.iter_moves(bits[turn], bits[1 - turn]):
+                following.add(bitboard.canonical(bitboard.apply_move(bits, turn, *move))[0])
+        layer = following
+    return [bits for bits in positions if bitboard.winner(bits) is None]
+
+
+def build(path=DEFAULT_PATH, plies=4, depth=3, time_limit_ms=None, verbose=False):
+    """ Searches every drop phase position with fewer than `plies` markers and
+    writes the chosen drops to path.
+
+    Args:
+        depth (int): search depth passed to Teeko2Player.search_root
+        time_limit_ms (float): if given, use iterative deepening with this budget
+            per position instead of a fixed depth
+    """
+    import game
+    player = game.Teeko2Player()
+    player.tablebase = None
+    player.book = None
+    entries = {}
+    positions = drop_positions(plies)
+    for n, bits in enumerate(positions):
+        turn = side_to_move(bits)
+        player.my_piece = player.pieces[turn]
+        if time_limit_ms is not None:
+            best = player.iterative_deepening(bits, turn, time_limit_ms)
+        else:
+            best = player.search_root(bits, turn, depth, 'alphabeta')
+        (row, col) = best[1]
+        entries[bitboard.pack(bits)] = row * bitboard.SIZE + col
+        if verbose:
+            print(str(n + 1) + "/" + str(len(positions)), best[1], player.stats)
+    save(entries, path)
+    return entries
+
+
+def save(entries, path=DEFAULT_PATH):
+    """ Writes {packed canonical position: destination index} to path """
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_COUNT.pack(len(entries)))
+        for key in sorted(entries):
+            f.write(_ENTRY.pack(key, entries[key]))
+    os.replace(tmp, path)
+
+
+def load(path=DEFAULT_PATH):
+    """ Reads a book file into {packed canonical position: destination index} """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(path + " is not a Teeko2 opening book")
+    (count,) = _COUNT.unpack_from(data, len(MAGIC))
+    start = len(MAGIC) + _COUNT.size
+    return dict(_ENTRY.iter_unpack(data[start:start + count * _ENTRY.size]))
+
+
+class OpeningBook:
+    """ Lazily loaded opening book. A missing file behaves like an empty book. """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.entries = None
+
+    def __len__(self):
+        return len(self._entries())
+
+    def _entries(self):
+        if self.entries is None:
+            self.entries = load(self.path) if os.path.exists(self.path) else {}
+        return self.entries
+
+    def move(self, state, turn):
+        """ Returns the (None, dst) drop stored for this position with
+        Teeko2Player.pieces[turn] to move, or None if the book has no entry.
+        """
+        entries = self._entries()
+        if not entries:
+            return None
+        bits = bitboard.to_bits(state)
+        if bitboard.popcount(bits[turn]) >= 4 or side_to_move(bits) != turn:
+            return None
+        (canon, k) = bitboard.canonical(bits)
+        dst = entries.get(bitboard.pack(canon))
+        if dst is None:
+            return None
+        dst = bitboard.SYMMETRIES[bitboard.INVERSE[k]][dst]
+        if (bits[0] | bits[1]) >> dst & 1:
+            return None
+        return (None, dst)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Teeko2 drop phase opening book")
+    parser.add_argument('--path', default=DEFAULT_PATH)
+    parser.add_argument('--plies', type=int, default=4)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--time-limit-ms', type=float, default=None)
+    args = parser.parse_args()
+    build(args.path, args.plies, args.depth, args.time_limit_ms, verbose=True)
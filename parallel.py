@@ -0,0 +1,158 @@
+""" Parallel root search for Teeko2Player over a process pool.
+
+The root position is expanded split_depth plies deep in the calling process.
+Every position at the split point becomes one task: a packed 50-bit board (see
+bitboard.pack), the side to move, the remaining depth, the searching color, the
+searching player's linear_eval weights, if it has any, and an alpha-beta
+window. Workers score their position with a fresh transposition table, so a
+task's result does not depend on which worker ran it or in what order.
+
+Root moves are searched as in a principal variation search, in three rounds of
+tasks. The tasks of the first root move get a full window, and its score alpha
+becomes the bound of the second round, a null-window test (alpha, alpha + one
+ulp) of every other root move. The few moves that fail high are searched again
+with the window (alpha, inf), which gives their exact scores. Scores are backed
+up through the split tree after each round, and the first best root move in
+search order is chosen, exactly as the serial search_root would choose it. Each
+round depends only on the results of the previous one, so the chosen move and
+score are deterministic.
+"""
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import bitboard
+import evaluator
+import transposition
+
+_player = None # worker-local Teeko2Player
+
+
+def _init_worker(tt_entries):
+    global _player
+    import game
+    _player = game.Teeko2Player(tt_entries)
+
+
+def _search_task(task):
+    """ Scores one split position in a worker. Returns (score, nodes, cutoffs). """
+    (packed, turn, depth, me, ply, weights, alpha, beta) = task
+    player = _player
+    player.my_piece = player.pieces[me]
+    if weights is None:
+        player.linear = None
+    elif player.linear is None or player.linear.weights != weights:
+        import linear_eval
+        player.linear = linear_eval.LinearEvaluator(weights=weights)
+    player.tt.clear()
+    player.killers = {}
+    player.stats = {'nodes': 0, 'cutoffs': 0}
+    board = evaluator.IncrementalBoard(bitboard.unpack(packed))
+    score = player.alpha_beta(board, depth, alpha, beta, turn, ply)
+    return (score, player.stats['nodes'], player.stats['cutoffs'])
+
+
+class ParallelSearch:
+    """ Process pool that scores root moves for Teeko2Player.search_root.
+
+    Args:
+        workers (int): number of worker processes, os.cpu_count() if None
+        split_depth (int): plies expanded before handing positions to workers;
+            1 splits on root moves, 2 on the replies to them and so on
+        tt_entries (int): transposition table size of each worker
+    """
+
+    def __init__(self, workers=None, split_depth=1, tt_entries=1 << 14):
+        if split_depth < 1:
+            raise ValueError("split_depth must be at least 1")
+        self.split_depth = split_depth
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                            initargs=(tt_entries,))
+
+    def search(self, player, state, turn, depth):
+        """ Same result as player.search_root(state, turn, depth, 'alphabeta') on a
+        player with an empty transposition table. Leaves node and cutoff totals
+        and the root score in player.stats.
+        """
+        bits = bitboard.to_bits(state)
+        me = player.pieces.index(player.my_piece)
+        entry = player.tt.probe(transposition.zobrist(bits, turn, me))
+        moves = player.ordered_moves(evaluator.IncrementalBoard(bits), turn, 0,
+                                     entry.move if entry else None)
+
+        tasks = []
+        weights = player.linear.weights if player.linear is not None else None
+        trees = [self._split(bitboard.apply_move(bits, turn, *move), (turn+1)%2, depth, me,
+                             self.split_depth - 1, 1, tasks, weights)
+                 for move in moves]
+        results = {}
+        player.stats = {'nodes': 0, 'cutoffs': 0}
+        self._run(player, tasks, results, trees[:1], float('-inf'), float('inf'))
+        alpha = self._backup(trees[0], results)
+        scores = [alpha]
+        if len(trees) > 1 and alpha < 1: # nothing beats a won game
+            self._run(player, tasks, results, trees[1:], alpha, math.nextafter(alpha, math.inf))
+            bounds = [self._backup(tree, results) for tree in trees[1:]]
+            high = [tree for (tree, bound) in zip(trees[1:], bounds) if bound > alpha]
+            self._run(player, tasks, results, high, alpha, float('inf'))
+            # a move that failed low scores alpha at most and loses the tie to
+            # the first move
+            scores += [self._backup(tree, results) if bound > alpha else float('-inf')
+                       for (tree, bound) in zip(trees[1:], bounds)]
+        best = max(range(len(scores)), key=lambda k: (scores[k], -k))
+        player.stats['score'] = scores[best]
+        player.killers[0] = moves[best]
+        return player.succ_entry(bits, turn, moves[best])
+
+    def _run(self, player, tasks, results, trees, alpha, beta):
+        """ Searches the tasks at the leaves of trees with the window (alpha,
+        beta), storing their results and adding their counts to player.stats.
+        """
+        indices = [index for tree in trees for index in self._leaves(tree)]
+        jobs = [tasks[index] + (alpha, beta) for index in indices]
+        for (index, result) in zip(indices, self.executor.map(_search_task, jobs)):
+            results[index] = result
+            player.stats['nodes'] += result[1]
+            player.stats['cutoffs'] += result[2]
+
+    def _split(self, bits, turn, depth, me, levels, ply, tasks, weights=None):
+        """ Expands bits `levels` plies deep. Leaves of the returned tree are
+        ('value', score) for decided games and ('task', index) for positions
+        queued in tasks; inner nodes are ('node', maximizing, children).
+        """
+        w = bitboard.winner(bits)
+        if w is not None:
+            return ('value', 1 if w == me else -1)
+        if levels == 0 or depth == 0:
+            tasks.append((bitboard.pack(bits), turn, depth, me, ply, weights))
+            return ('task', len(tasks) - 1)
+        children = [self._split(bitboard.apply_move(bits, turn, *move), (turn+1)%2, depth-1,
+                                me, levels-1, ply+1, tasks, weights)
+                    for move in bitboard.iter_moves(bits[turn], bits[1 - turn])]
+        return ('node', turn == me, children)
+
+    def _leaves(self, tree):
+        """ Task indices at the leaves of a tree made by _split """
+        if tree[0] == 'task':
+            return [tree[1]]
+        if tree[0] == 'node':
+            return [index for child in tree[2] for index in self._leaves(child)]
+        return []
+
+    def _backup(self, tree, results):
+        if tree[0] == 'value':
+            return tree[1]
+        if tree[0] == 'task':
+            return results[tree[1]][0]
+        scores = [self._backup(child, results) for child in tree[2]]
+        if tree[1]:
+            return max(scores, default=float('-inf'))
+        return min(scores, default=float('inf'))
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,252 @@
+""" Pondering: searching on the opponent's time.
+
+After Teeko2Player.make_move() picks a move, a Ponderer guesses the
+opponent's reply (the best reply stored in the transposition table by the
+search just finished, otherwise the first move in static search order) and
+searches the position after it in a background thread, with the same depth
+or time limit, until the search completes or budget_ms has passed. The search
+runs on a helper player that shares the owner's transposition table, so even
+an unfinished ponder search leaves its results there.
+
+When the next make_move() is asked about the predicted position the ponder
+search is promoted: a fixed-depth result is waited for and played as is, and a
+timed search is given the rest of the move's time limit and then stopped, its
+deepest completed iteration played. Any other position cancels the search,
+which stops within a few dozen nodes, and make_move() searches normally.
+opponent_move() cancels a mismatched search as soon as the move is known.
+
+Only the searches supported() accepts are pondered: the others' results could
+not be played in place of their own. Only one search runs at a time, so a game
+uses at most budget_ms of extra search time per move. The helper never touches the owner's killers or stats.
+
+Usage (an opponent that thinks for --think-ms per move):
+    python ponder.py [--games 4] [--depth 3] [--budget-ms 500] [--think-ms 200]
+"""
+import argparse
+import random
+import threading
+import time
+
+import bitboard
+import evaluator
+import game
+import threats
+import transposition
+
+
+def supported(search, time_limit_ms):
+    """ True for the make_move() searches a ponder search can stand in for:
+    timed searches (iterative deepening) other than MCTS, and fixed-depth
+    alpha-beta searches, serial or parallel.
+    """
+    if time_limit_ms is not None:
+        return search != 'mcts'
+    return search in ('alphabeta', 'parallel')
+
+
+class Ponderer:
+    """ Background searcher for one Teeko2Player.
+
+    Args:
+        player (Teeko2Player): the owner, whose transposition table is shared
+        budget_ms (float): longest a ponder search runs
+    """
+
+    def __init__(self, player, budget_ms=1000):
+        self.player = player
+        self.budget_ms = budget_ms
+        self.helper = game.Teeko2Player(tt=player.tt)
+        self.helper.book = None
+        self.helper.tablebase = None
+        self.thread = None
+        self.predicted = None # position the running search is about
+        self.job = None # (depth, search, time_limit_ms) of the move that started it
+        self.result = None # (succ entry, stats) of the finished search
+        self.started = 0.0
+        self.stats = {'searches': 0, 'hits': 0, 'misses': 0, 'pondered_ms': 0.0}
+
+    def predict(self, bits, turn):
+        """ The likely (src, dst) reply of color turn in an undecided position """
+        me = self.player.pieces.index(self.player.my_piece)
+        entry = self.player.tt.probe(transposition.zobrist(bits, turn, me))
+        if entry is not None and entry.move is not None and \
+                bitboard.is_legal(bits[turn], bits[1 - turn], *entry.move):
+            return entry.move
+        move = threats.forced_move(bits, turn)
+        if move is not None:
+            return move
+        moves = self.helper.ordered_moves(evaluator.IncrementalBoard(bits), turn, 1)
+        return moves[0] if moves else None
+
+    def start(self, bits, turn, depth=1, search='alphabeta', time_limit_ms=None):
+        """ Starts pondering the predicted reply of color turn in bits, the
+        position after the owner's move, cancelling any search still running.
+        The job arguments are those of the make_move call that moved.
+        """
+        self.cancel()
+        if not supported(search, time_limit_ms) or bitboard.winner(bits) is not None:
+            return
+        reply = self.predict(bits, turn)
+        if reply is None:
+            return
+        predicted = bitboard.apply_move(bits, turn, *reply)
+        if bitboard.winner(predicted) is not None:
+            return
+        helper = self.helper
+        helper.my_piece = self.player.my_piece
+        helper.opp = self.player.opp
+        helper.linear = self.player.linear
+        helper.killers = {}
+        self.predicted = predicted
+        self.job = (depth, search, time_limit_ms)
+        self.result = None
+        self.started = time.perf_counter()
+        self.stats['searches'] += 1
+        self.thread = threading.Thread(target=self._run, args=(predicted, 1 - turn),
+                                       daemon=True)
+        self.thread.start()
+
+    def _run(self, bits, me):
+        helper = self.helper
+        (depth, search, time_limit_ms) = self.job
+        try:
+            if time_limit_ms is not None:
+                best = helper.iterative_deepening(bits, me, self.budget_ms)
+            else:
+                helper.deadline = self.started + self.budget_ms / 1000.0
+                best = helper.search_root(bits, me, depth, 'alphabeta')
+            self.result = (best, helper.stats)
+        except game.SearchTimeout:
+            pass
+        finally:
+            helper.deadline = float('inf')
+            self.stats['pondered_ms'] += (time.perf_counter() - self.started) * 1000.0
+
+    def _stop(self):
+        """ Stops the running search and waits for its thread to end """
+        if self.thread is None:
+            return
+        while self.thread.is_alive():
+            # iterative_deepening sets its own deadline when it starts
+            self.helper.deadline = float('-inf')
+            self.thread.join(0.005)
+        self.thread = None
+
+    def cancel(self):
+        """ Stops and discards the current ponder search, if any """
+        self._stop()
+        self.predicted = None
+        self.result = None
+
+    def opponent_moved(self, bits):
+        """ Cancels the search unless bits, the position after the opponent's
+        move, is the one being pondered.
+        """
+        if self.predicted is not None and bits != self.predicted:
+            self.stats['misses'] += 1
+            self.cancel()
+
+    def take(self, bits, depth=1, search='alphabeta', time_limit_ms=None):
+        """ Called by make_move() for bits with the owner to move. Returns the
+        promoted search's succ() entry, or None (after cancelling a mismatched
+        search) if make_move() should search itself. Leaves the ponder
+        search's stats in the owner's stats.
+        """
+        if not supported(search, time_limit_ms):
+            self.cancel()
+            return None
+        fixed = time_limit_ms is None
+        if self.predicted is None or bits != self.predicted or \
+                self.job != (depth, search, time_limit_ms):
+            if self.predicted is not None:
+                self.stats['misses'] += 1
+            self.cancel()
+            return None
+        self.stats['hits'] += 1
+        if self.thread is not None:
+            if fixed:
+                # the search stops by itself once its budget runs out
+                remaining = self.started + self.budget_ms / 1000.0 - time.perf_counter()
+                self.thread.join(max(0.0, remaining))
+            else:
+                self.thread.join(time_limit_ms / 1000.0)
+        self._stop()
+        result = self.result
+        self.predicted = None
+        self.result = None
+        if result is None:
+            return None
+        (best, stats) = result
+        self.player.stats = dict(stats, pondered=True)
+        return best
+
+    def close(self):
+        self.cancel()
+
+
+def play(engine, depth, time_limit_ms, think_ms, seed, opening_plies=2, max_plies=120):
+    """ Plays engine (black) against a depth 1 player that thinks for think_ms
+    per move. Returns (winner, engine move latencies in ms).
+    """
+    rng = random.Random(seed)
+    opponent = game.Teeko2Player()
+    opponent.my_piece = opponent.pieces[1]
+    opponent.opp = opponent.pieces[0]
+    opponent.book = None
+    opponent.tablebase = None
+    engine.my_piece = engine.pieces[0]
+    engine.opp = engine.pieces[1]
+    engine.position = (0, 0)
+    latencies = []
+    for ply in range(max_plies):
+        turn = ply % 2
+        state = engine.board
+        if ply < opening_plies:
+            move = bitboard.to_move_list(*rng.choice(list(bitboard.iter_moves(
+                engine.position[turn], engine.position[1 - turn]))))
+        elif turn == 0:
+            start = time.perf_counter()
+            move = engine.make_move(state, depth, 'alphabeta', time_limit_ms)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+        else:
+            time.sleep(think_ms / 1000.0)
+            move = opponent.make_move(state, 1, 'alphabeta')
+        if turn == 0:
+            engine.place_piece(move, engine.my_piece)
+        else:
+            engine.opponent_move(move)
+        w = bitboard.winner(engine.position)
+        if w is not None:
+            if engine.ponder is not None:
+                engine.ponder.cancel()
+            return (w, latencies)
+    if engine.ponder is not None:
+        engine.ponder.cancel()
+    return (None, latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare move latency with and without pondering")
+    parser.add_argument('--games', type=int, default=4)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--time-limit-ms', type=float, default=None)
+    parser.add_argument('--budget-ms', type=float, default=500)
+    parser.add_argument('--think-ms', type=float, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for pondering in (False, True):
+        latencies = []
+        engine = game.Teeko2Player()
+        engine.book = None
+        engine.tablebase = None
+        if pondering:
+            engine.ponder = Ponderer(engine, args.budget_ms)
+        for g in range(args.games):
+            latencies += play(engine, args.depth, args.time_limit_ms, args.think_ms,
+                              args.seed + g)[1]
+        line = ('ponder' if pondering else 'plain').ljust(7) + ' mean ' + \
+            str(round(sum(latencies) / len(latencies), 2)) + ' ms  p90 ' + \
+            str(round(sorted(latencies)[int(0.9 * (len(latencies) - 1))], 2)) + ' ms'
+        if pondering:
+            line += '  ' + str(engine.ponder.stats)
+        print(line)
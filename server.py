@@ -0,0 +1,396 @@
+""" Asyncio front-end serving Teeko2Player moves for many games at once.
+
+Requests and replies are JSON objects, one per line, over stdin/stdout or a
+local TCP socket. Every request may carry an "id", which is echoed in its
+reply; replies are written as soon as they are ready, so they can come back
+out of order.
+
+    {"id": 1, "op": "new", "game": "g1", "color": "r"}
+    {"id": 2, "op": "opponent", "game": "g1", "move": [[2, 2]]}
+    {"id": 3, "op": "move", "game": "g1", "depth": 2, "deadline_ms": 500}
+    {"id": 4, "op": "close", "game": "g1"}
+    {"id": 5, "op": "stats"}
+
+A "move" reply holds the engine's move in make_move format, or "ok": false and
+an "error". Game state lives in a session.SessionManager on the event loop;
+searches run on a process pool. Queued searches are started cheapest first by
+an estimate of their cost, so drop phase replies are not held up by deep move
+phase searches. A request whose deadline passes while it is queued fails
+without searching, and a time-limited search is given at most the time its
+deadline leaves, less DISPATCH_MARGIN_MS for the round trip to the worker
+process. A fixed-depth alpha-beta search is stopped once that time is up
+and answered with the same error as an expired request; minimax cannot be
+stopped, so past its deadline the finished result is dropped. Depths beyond
+MAX_DEPTH are refused. Each connection stops reading once max_pending of its
+requests are unanswered.
+
+Usage:
+    python server.py [--port 7842 | --stdio | --demo 20] [--workers 4]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bitboard
+import session
+
+SEARCHES = ('minimax', 'alphabeta')
+# deepest fixed-depth search served, about a second of move phase search each
+MAX_DEPTH = {'minimax': 3, 'alphabeta': 8}
+# rough search speed used to turn a depth into an expected time
+NODES_PER_MS = 50.0
+# time kept back from a timed search for queueing, setup and the reply to come
+# back from the worker process
+DISPATCH_MARGIN_MS = 25.0
+
+_engine = None
+
+
+def _init_worker(tt_entries):
+    global _engine
+    import game
+    _engine = game.Teeko2Player(tt_entries)
+
+
+def _search(job):
+    """ Runs in a worker process: returns (move, nodes, elapsed ms), with move
+    None if a fixed-depth search ran out of budget_ms
+    """
+    import game
+    (position, color, depth, search, time_limit_ms, budget_ms) = job
+    start = time.perf_counter()
+    if budget_ms is not None:
+        _engine.deadline = start + budget_ms / 1000.0
+    try:
+        move = session.engine_move(_engine, position, color, depth, search, time_limit_ms)
+    except game.SearchTimeout:
+        move = None
+    finally:
+        _engine.deadline = float('inf')
+    return (move, _engine.stats.get('nodes', 0), (time.perf_counter() - start) * 1000.0)
+
+
+def estimate_cost(position, color, depth, time_limit_ms=None):
+    """ Expected search time in milliseconds, used to order the queue """
+    if time_limit_ms is not None:
+        return time_limit_ms
+    branching = sum(1 for move in bitboard.iter_moves(position[color], position[1 - color]))
+    return max(branching, 1) ** (depth + 1) / NODES_PER_MS
+
+
+class RequestError(Exception):
+    """ A request that cannot be served; its message is sent back to the client """
+
+
+def _field(request, key, default, kind, minimum):
+    """ request[key] (default if absent), checked to be a kind (int or float)
+    no smaller than minimum; None is allowed only as the default.
+    """
+    value = request.get(key, default)
+    if value is None and default is None:
+        return None
+    # JSON true and false decode to bool, a subclass of int
+    numeric = (int,) if kind is int else (int, float)
+    if isinstance(value, bool) or not isinstance(value, numeric) or not value >= minimum:
+        raise RequestError(key + " must be " + ("an integer" if kind is int else "a number") +
+                           " of at least " + str(minimum))
+    return value
+
+
+class GameServer:
+    """ Schedules move requests for the games in a SessionManager.
+
+    Args:
+        workers (int): search processes
+        max_sessions (int): most games open at once
+        max_pending (int): unanswered requests allowed per connection
+        tt_entries (int): transposition table size in each worker
+        default_deadline_ms (float): deadline of requests that do not set one;
+            None waits as long as the search takes
+    """
+
+    def __init__(self, workers=2, max_sessions=10000, max_pending=64, tt_entries=1 << 16,
+                 default_deadline_ms=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.tt_entries = tt_entries
+        self.default_deadline_ms = default_deadline_ms
+        self.sessions = session.SessionManager(max_sessions, tt_entries=1)
+        self.searching = set() # games with a search queued or running
+        self.queue = None
+        self.pool = None
+        self.dispatchers = []
+        self.counter = itertools.count()
+        self.stats = {'requests': 0, 'searches': 0, 'errors': 0, 'expired': 0}
+
+    async def start(self):
+        self.queue = asyncio.PriorityQueue()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(self.tt_entries,))
+        self.dispatchers = [asyncio.ensure_future(self._dispatch()) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self.dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.dispatchers = []
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _dispatch(self):
+        """ Runs queued searches, cheapest first, one at a time per worker """
+        loop = asyncio.get_event_loop()
+        while True:
+            (cost, seq, job, deadline, future) = await self.queue.get()
+            if future.done():
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.stats['expired'] += 1
+                future.set_exception(RequestError("deadline exceeded"))
+                continue
+            (position, color, depth, search, time_limit_ms, budget_ms) = job
+            if deadline != float('inf'):
+                budget_ms = remaining * 1000.0 - DISPATCH_MARGIN_MS
+                if budget_ms <= 0:
+                    self.stats['expired'] += 1
+                    future.set_exception(RequestError("deadline exceeded"))
+                    continue
+                if time_limit_ms is not None:
+                    time_limit_ms = min(time_limit_ms, budget_ms)
+                job = (position, color, depth, search, time_limit_ms, budget_ms)
+            try:
+                result = await loop.run_in_executor(self.pool, _search, job)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if future.done():
+                    continue
+                if result[0] is None:
+                    self.stats['expired'] += 1
+                    future.set_exception(RequestError("deadline exceeded"))
+                else:
+                    future.set_result(result)
+
+    async def handle(self, request):
+        """ Serves one decoded request and returns the reply object """
+        self.stats['requests'] += 1
+        reply = {'id': request.get('id')} if isinstance(request, dict) else {'id': None}
+        try:
+            if not isinstance(request, dict):
+                raise RequestError("request must be a JSON object")
+            reply.update(await self._handle(request))
+            reply['ok'] = True
+        except (RequestError, session.SessionError) as e:
+            self.stats['errors'] += 1
+            reply.update({'ok': False, 'error': str(e)})
+        except Exception as e:
+            # e.g. a search failing in its worker: still answer the request
+            self.stats['errors'] += 1
+            reply.update({'ok': False, 'error': type(e).__name__ + ": " + str(e)})
+        return reply
+
+    async def _handle(self, request):
+        op = request.get('op')
+        game_id = request.get('game')
+        if op == 'stats':
+            return {'stats': dict(self.stats, games=len(self.sessions),
+                                  queued=self.queue.qsize() if self.queue else 0,
+                                  searching=len(self.searching))}
+        if game_id is None:
+            raise RequestError("missing game")
+        if isinstance(game_id, bool) or not isinstance(game_id, (str, int)):
+            raise RequestError("game must be a string or an integer")
+        if op == 'new':
+            color = request.get('color', 'b')
+            if color not in ('b', 'r'):
+                raise RequestError("color must be 'b' or 'r'")
+            self.sessions.create(game_id, color)
+            return {}
+        if op == 'close':
+            self.sessions.close(game_id)
+            return {}
+        if game_id in self.searching:
+            raise RequestError("a search is already running for game " + str(game_id))
+        if op == 'opponent':
+            try:
+                move = [tuple(square) for square in request['move']]
+                valid = 1 <= len(move) <= 2 and all(
+                    len(square) == 2 and all(isinstance(x, int) and 0 <= x < bitboard.SIZE
+                                             for x in square) for square in move)
+            except (KeyError, TypeError):
+                valid = False
+            if not valid:
+                raise RequestError("missing or malformed move")
+            self.sessions.opponent_move(game_id, move)
+            return {}
+        if op == 'move':
+            return await self._move(game_id, request)
+        raise RequestError("unknown op " + str(op))
+
+    async def _move(self, game_id, request):
+        game = self.sessions.get(game_id)
+        if game.turn != game.color:
+            raise RequestError("it is not the engine's turn in game " + str(game_id))
+        if game.winner is not None:
+            raise RequestError("game " + str(game_id) + " is over")
+        search = request.get('search', 'alphabeta')
+        if search not in SEARCHES:
+            raise RequestError("search must be one of " + ", ".join(SEARCHES))
+        depth = _field(request, 'depth', 1, int, 0)
+        if depth > MAX_DEPTH[search]:
+            raise RequestError("depth must be at most " + str(MAX_DEPTH[search]) +
+                               " for " + search)
+        time_limit_ms = _field(request, 'time_limit_ms', None, float, 0)
+        deadline_ms = _field(request, 'deadline_ms', self.default_deadline_ms, float, 0)
+        deadline = float('inf') if deadline_ms is None else time.monotonic() + deadline_ms / 1000.0
+        position = game.position
+        job = (position, game.color, depth, search, time_limit_ms, None)
+        future = asyncio.get_event_loop().create_future()
+        cost = estimate_cost(position, game.color, depth, time_limit_ms)
+        self.searching.add(game_id)
+        try:
+            self.queue.put_nowait((cost, next(self.counter), job, deadline, future))
+            timeout = None if deadline_ms is None else max(deadline - time.monotonic(), 0)
+            try:
+                (move, nodes, elapsed_ms) = await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                future.cancel()
+                self.stats['expired'] += 1
+                raise RequestError("deadline exceeded")
+        finally:
+            self.searching.discard(game_id)
+        self.stats['searches'] += 1
+        if game_id not in self.sessions or game.position != position:
+            raise RequestError("game " + str(game_id) + " changed during the search")
+        game.apply(bitboard.from_move_list(move))
+        return {'move': move, 'nodes': nodes, 'elapsed_ms': elapsed_ms}
+
+    async def serve_stream(self, reader, writer):
+        """ Answers JSON-lines requests from reader on writer until EOF """
+        slots = asyncio.Semaphore(self.max_pending)
+        tasks = set()
+
+        async def answer(line):
+            try:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    reply = {'id': None, 'ok': False, 'error': "invalid JSON"}
+                else:
+                    reply = await self.handle(request)
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+            finally:
+                slots.release()
+
+        while True:
+            await slots.acquire() # backpressure: stop reading while max_pending are open
+            line = await reader.readline()
+            if not line:
+                slots.release()
+                break
+            if not line.strip():
+                slots.release()
+                continue
+            task = asyncio.ensure_future(answer(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+class LocalClient:
+    """ In-process stand-in for a remote client, for tests and offline use """
+
+    def __init__(self, server):
+        self.server = server
+        self.ids = itertools.count(1)
+
+    async def request(self, op, **fields):
+        fields.update({'id': next(self.ids), 'op': op})
+        return await self.server.handle(fields)
+
+    async def play_random(self, game_id, color='b', seed=0, depth=1, max_plies=100, **options):
+        """ Plays a game against a random opponent and returns the server's
+        session for it.
+        """
+        import random
+        rng = random.Random(seed)
+        await self.request('new', game=game_id, color=color)
+        game = self.server.sessions.get(game_id)
+        while game.winner is None and game.plies < max_plies:
+            if game.turn == game.color:
+                reply = await self.request('move', game=game_id, depth=depth, **options)
+                if not reply['ok']:
+                    raise RequestError(reply['error'])
+            else:
+                legal = list(bitboard.iter_moves(game.position[game.turn],
+                                                 game.position[1 - game.turn]))
+                move = bitboard.to_move_list(*rng.choice(legal))
+                await self.request('opponent', game=game_id, move=move)
+        return game
+
+
+class _StdoutWriter:
+    """ Minimal StreamWriter for stdout, which may be a file rather than a pipe """
+
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+
+    async def drain(self):
+        sys.stdout.buffer.flush()
+
+
+async def _stdio_streams():
+    reader = asyncio.StreamReader()
+    await asyncio.get_event_loop().connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    return reader, _StdoutWriter()
+
+
+async def main(args):
+    server = GameServer(args.workers, max_pending=args.max_pending,
+                        default_deadline_ms=args.deadline_ms)
+    async with server:
+        if args.demo:
+            client = LocalClient(server)
+            games = await asyncio.gather(*[client.play_random(g, 'br'[g % 2], seed=g,
+                                                              depth=args.depth)
+                                           for g in range(args.demo)])
+            for game in games:
+                print(game.game_id, 'plies', game.plies, 'winner', game.winner)
+            print(server.stats)
+        elif args.stdio:
+            await server.serve_stream(*await _stdio_streams())
+        else:
+            tcp = await asyncio.start_server(server.serve_stream, args.host, args.port)
+            async with tcp:
+                await tcp.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Teeko2Player moves over JSON lines")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7842)
+    parser.add_argument('--stdio', action='store_true', help="serve stdin/stdout instead")
+    parser.add_argument('--demo', type=int, default=0,
+                        help="play this many games against random local clients and exit")
+    parser.add_argument('--depth', type=int, default=1, help="search depth used by --demo")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--max-pending', type=int, default=64)
+    parser.add_argument('--deadline-ms', type=float, default=None)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,155 @@
+""" Game sessions for hosting many concurrent Teeko2 games in one process.
+
+A GameSession holds only what a game needs between moves: the bitboard pair,
+the color the engine plays, the side to move and a ply counter. The phase is
+derived from the position. A SessionManager keeps any number of sessions up to
+a limit and runs all of their searches on one shared Teeko2Player whose
+transposition table (keyed on position, side to move and searching color) is
+shared by every game, so memory stays bounded however many games are open.
+"""
+import time
+from collections import OrderedDict
+
+import bitboard
+import game
+import transposition
+
+
+class SessionError(Exception):
+    """ Raised for unknown or duplicate games, illegal moves and full managers """
+
+
+def engine_move(engine, position, color, depth=1, search='alphabeta', time_limit_ms=None):
+    """ Points a shared Teeko2Player at one game and returns its make_move()
+    result for position, with engine.pieces[color] to move.
+    """
+    engine.my_piece = engine.pieces[color]
+    engine.opp = engine.pieces[1 - color]
+    engine.position = position
+    engine.killers = {}
+    engine.stats = {}
+    return engine.make_move(position, depth, search, time_limit_ms)
+
+
+class GameSession:
+    """ State of one game.
+
+    Attributes:
+        game_id: the caller's identifier for the game
+        position (tuple): (black, red) bitboard pair
+        color (int): index in Teeko2Player.pieces of the engine's color
+        turn (int): index in Teeko2Player.pieces of the side to move
+        plies (int): moves played so far
+        last_used (float): time.monotonic() of the last move
+    """
+    __slots__ = ('game_id', 'position', 'color', 'turn', 'plies', 'last_used')
+
+    def __init__(self, game_id, color):
+        self.game_id = game_id
+        self.position = (0, 0)
+        self.color = color
+        self.turn = 0 # black drops first
+        self.plies = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def phase(self):
+        """ 'drop' while the side to move has markers left, 'move' after that,
+        'over' once someone has won
+        """
+        if self.winner is not None:
+            return 'over'
+        return 'drop' if bitboard.popcount(self.position[self.turn]) < 4 else 'move'
+
+    @property
+    def winner(self):
+        """ Index of the winning color, or None """
+        return bitboard.winner(self.position)
+
+    def apply(self, move):
+        """ Plays a (src, dst) move for the side to move after checking it is legal """
+        if self.winner is not None:
+            raise SessionError("Game " + str(self.game_id) + " is over")
+        if move not in bitboard.iter_moves(self.position[self.turn], self.position[1 - self.turn]):
+            raise SessionError("Illegal move in game " + str(self.game_id) + ": " +
+                               str(bitboard.to_move_list(*move)))
+        self.position = bitboard.apply_move(self.position, self.turn, *move)
+        self.turn = 1 - self.turn
+        self.plies += 1
+        self.last_used = time.monotonic()
+
+
+class SessionManager:
+    """ Hosts up to max_sessions games on one shared search engine.
+
+    Args:
+        max_sessions (int): most games open at once
+        tt_entries (int): size of the transposition table shared by all games
+        idle_timeout (float): seconds after which an idle game may be dropped to
+            make room for a new one; None never drops games
+    """
+
+    def __init__(self, max_sessions=10000, tt_entries=1 << 18, idle_timeout=None):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = OrderedDict() # least recently used first
+        self.engine = game.Teeko2Player(tt=transposition.TranspositionTable(tt_entries))
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, game_id):
+        return game_id in self.sessions
+
+    def create(self, game_id, color='b'):
+        """ Opens a game in which the engine plays color ('b' or 'r') """
+        if game_id in self.sessions:
+            raise SessionError("Game " + str(game_id) + " already exists")
+        if len(self.sessions) >= self.max_sessions and not self.expire():
+            raise SessionError("Too many open games")
+        session = GameSession(game_id, self.engine.pieces.index(color))
+        self.sessions[game_id] = session
+        return session
+
+    def get(self, game_id):
+        try:
+            session = self.sessions[game_id]
+        except KeyError:
+            raise SessionError("Unknown game " + str(game_id))
+        self.sessions.move_to_end(game_id)
+        return session
+
+    def close(self, game_id):
+        self.sessions.pop(game_id, None)
+
+    def expire(self, max_idle=None):
+        """ Drops games idle for more than max_idle seconds (default
+        idle_timeout) and returns how many were dropped.
+        """
+        max_idle = self.idle_timeout if max_idle is None else max_idle
+        if max_idle is None:
+            return 0
+        cutoff = time.monotonic() - max_idle
+        stale = [game_id for game_id, s in self.sessions.items() if s.last_used < cutoff]
+        for game_id in stale:
+            del self.sessions[game_id]
+        return len(stale)
+
+    def opponent_move(self, game_id, move):
+        """ Applies the opponent's move, in Teeko2Player.opponent_move format """
+        session = self.get(game_id)
+        if session.turn == session.color:
+            raise SessionError("It is not the opponent's turn in game " + str(game_id))
+        session.apply(bitboard.from_move_list(move))
+
+    def make_move(self, game_id, depth=1, search='alphabeta', time_limit_ms=None):
+        """ Chooses and applies the engine's move, returned in make_move format """
+        session = self.get(game_id)
+        if session.turn != session.color:
+            raise SessionError("It is not the engine's turn in game " + str(game_id))
+        if session.winner is not None:
+            raise SessionError("Game " + str(game_id) + " is over")
+        move = engine_move(self.engine, session.position, session.color, depth, search,
+                           time_limit_ms)
+        session.apply(bitboard.from_move_list(move))
+        return move
@@ -0,0 +1,405 @@
+""" Retrograde-analysis endgame tablebase for the Teeko2 move phase.
+
+Once all eight markers are down, a position is fixed by the four black squares,
+the four red squares and the side to move: C(25,4) * C(21,4) * 2 positions.
+Each gets one byte in the table file, after a 16-byte header:
+
+    0           draw (neither side can force a win)
+    1..127      the side to move wins; distance = value - WIN in plies
+    128..254    the side to move loses; distance = value - LOSS in plies
+
+Distance 0 means the game is already over. The table is built by retrograde
+analysis, one distance level at a time: every predecessor of a lost position is
+a win one ply further away, and a predecessor whose moves all lead to won
+positions is a loss. Each level is idempotent, so an interrupted build picks up
+at the last finished level (or initialization chunk) and simply redoes the
+work after it, listing the positions an interrupted level had already written
+again; the frontier is deduplicated before every level.
+
+Usage:
+    python tablebase.py [--path teeko2_moves.tb] [--workers N]
+"""
+import argparse
+import json
+import math
+import mmap
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import bitboard
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'teeko2_moves.tb')
+MAGIC = b'TK2TB\x00\x01\x00'
+HEADER_SIZE = 16
+
+DRAW = 0
+WIN = 1
+LOSS = 128
+MAX_DISTANCE = 126
+
+
+def _ranked(n):
+    """ 4-subsets of n squares as bitmasks, in colexicographic order """
+    masks = [sum(1 << i for i in c) for c in combinations(range(n), 4)]
+    masks.sort(key=lambda m: sorted((i for i in range(n) if m >> i & 1), reverse=True))
+    return masks
+
+
+N_BLACK = math.comb(25, 4) # black marker sets
+N_RED = math.comb(21, 4) # red marker sets on the squares black leaves free
+SIZE = N_BLACK * N_RED * 2
+
+_sets = None
+
+
+def _rank_tables():
+    """ (black sets, red sets, black rank, red rank), built on first use since
+    they take a tenth of a second: the ranked 4-subsets of the 25 squares and
+    of the 21 squares left free by black, and their inverse maps
+    """
+    global _sets
+    if _sets is None:
+        black_sets = _ranked(25)
+        red_sets = _ranked(21)
+        _sets = (black_sets, red_sets, {m: i for i, m in enumerate(black_sets)},
+                 {m: i for i, m in enumerate(red_sets)})
+    return _sets
+
+
+def index(bits, turn):
+    """ Table index of a move phase position with Teeko2Player.pieces[turn] to
+    move. Raises KeyError if either color does not have exactly four markers.
+    """
+    (black_sets, red_sets, black_rank, red_rank) = _rank_tables()
+    black, red = bits
+    compressed = 0
+    x = red
+    while x:
+        low = x & -x
+        # number the squares that black does not occupy 0..20
+        compressed |= low >> bitboard.popcount(black & (low - 1))
+        x ^= low
+    return ((black_rank[black] * N_RED + red_rank[compressed]) << 1) | turn
+
+
+def _free_squares(black):
+    return [i for i in range(25) if not black >> i & 1]
+
+
+def position(idx):
+    """ Inverse of index(): returns ((black, red), turn) """
+    (black_sets, red_sets, black_rank, red_rank) = _rank_tables()
+    turn = idx & 1
+    (b, r) = divmod(idx >> 1, N_RED)
+    black = black_sets[b]
+    free = _free_squares(black)
+    red = 0
+    compressed = red_sets[r]
+    for k in range(21):
+        if compressed >> k & 1:
+            red |= 1 << free[k]
+    return ((black, red), turn)
+
+
+def decode(value):
+    """ Returns (result, distance) for a table byte, result being 'win', 'loss'
+    or 'draw' for the side to move.
+    """
+    if value == DRAW:
+        return ('draw', None)
+    if value < LOSS:
+        return ('win', value - WIN)
+    return ('loss', value - LOSS)
+
+
+def predecessors(bits, turn):
+    """ Positions one move before (bits, turn): the color that just moved takes
+    one marker back to an empty neighbor. Returned with that color to move.
+    """
+    mover = 1 - turn
+    mine, theirs = bits[mover], bits[turn]
+    occupied = mine | theirs
+    prev = []
+    x = mine
+    while x:
+        low = x & -x
+        src = low.bit_length() - 1
+        for dst in bitboard.NEIGHBORS[src]:
+            if not occupied >> dst & 1:
+                moved = (mine ^ low) | (1 << dst)
+                prev.append(((moved, theirs) if mover == 0 else (theirs, moved), mover))
+        x ^= low
+    return prev
+
+
+############################################################################
+#
+# Building
+#
+############################################################################
+
+_table = None # worker-local writable map of the partial table
+
+
+def _open_table(path):
+    global _table
+    if _table is None:
+        f = open(path, 'r+b')
+        _table = mmap.mmap(f.fileno(), 0)
+        f.close()
+    return _table
+
+
+def _init_chunk(path, first, last):
+    """ Scores the finished games among black ranks [first, last) and returns
+    the indices of those positions, which form distance level 0.
+    """
+    table = _open_table(path)
+    (black_sets, red_sets, black_rank, red_rank) = _rank_tables()
+    decided = array('I')
+    n_red = N_RED
+    for b in range(first, last):
+        black = black_sets[b]
+        free = _free_squares(black)
+        for r in range(n_red):
+            compressed = red_sets[r]
+            red = 0
+            for k in range(21):
+                if compressed >> k & 1:
+                    red |= 1 << free[k]
+            bits = (black, red)
+            w = bitboard.winner(bits)
+            for turn in (0, 1):
+                idx = ((b * n_red + r) << 1) | turn
+                if w is not None:
+                    value = WIN if w == turn else LOSS
+                elif not any(True for move in bitboard.iter_moves(bits[turn], bits[1 - turn])):
+                    value = LOSS # no legal move
+                else:
+                    continue
+                table[HEADER_SIZE + idx] = value
+                decided.append(idx)
+    return decided.tobytes()
+
+
+def _all_children_won(table, bits, turn, level):
+    """ True if every move from (bits, turn) reaches a position that the opponent
+    has won in at most level plies.
+    """
+    for (src, dst) in bitboard.iter_moves(bits[turn], bits[1 - turn]):
+        child = bitboard.apply_move(bits, turn, src, dst)
+        value = table[HEADER_SIZE + index(child, 1 - turn)]
+        if not WIN <= value <= WIN + level:
+            return False
+    return True
+
+
+def _level_chunk(path, level, frontier, redo=False):
+    """ Resolves the predecessors of the level positions in frontier and returns
+    those at level + 1, each time one is written. With redo, for a level an
+    interrupted build may have half done, positions already holding exactly
+    that value are returned as well, so nothing written before is lost; the
+    caller removes the duplicates.
+    """
+    table = _open_table(path)
+    found = array('I')
+    indices = array('I')
+    indices.frombytes(frontier)
+    for idx in indices:
+        value = table[HEADER_SIZE + idx]
+        lost = value >= LOSS
+        (bits, turn) = position(idx)
+        for (prev, prev_turn) in predecessors(bits, turn):
+            if bitboard.winner(prev) is not None:
+                continue
+            p = index(prev, prev_turn)
+            old = table[HEADER_SIZE + p]
+            if lost:
+                new = WIN + level + 1
+            else:
+                new = LOSS + level + 1
+            if old == new:
+                if redo:
+                    found.append(p)
+                continue
+            if old != DRAW:
+                continue
+            if not lost and not _all_children_won(table, prev, prev_turn, level):
+                continue
+            table[HEADER_SIZE + p] = new
+            found.append(p)
+    return found.tobytes()
+
+
+class _Progress:
+    """ Build checkpoint stored next to the partial table as JSON """
+
+    def __init__(self, path):
+        self.path = path + '.state'
+        self.data = {'stage': 'init', 'chunks_done': [], 'level': 0}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.data = json.load(f)
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+
+
+def _split(items, parts):
+    step = max(1, -(-len(items) // parts))
+    return [items[k:k + step] for k in range(0, len(items), step)]
+
+
+def build(path=DEFAULT_PATH, workers=None, chunk=64):
+    """ Builds the move phase tablebase at path, resuming an interrupted build.
+
+    Args:
+        path (str): output file; work in progress lives in path + '.partial',
+            '.state' and '.frontier' until the table is complete
+        workers (int): worker processes, os.cpu_count() if None
+        chunk (int): black ranks per initialization task
+    """
+    partial = path + '.partial'
+    frontier_path = path + '.frontier'
+    progress = _Progress(path)
+    if not os.path.exists(partial):
+        with open(partial, 'wb') as f:
+            f.write(MAGIC.ljust(HEADER_SIZE, b'\x00'))
+            f.truncate(HEADER_SIZE + SIZE)
+        progress = _Progress(path)
+        progress.data = {'stage': 'init', 'chunks_done': [], 'level': 0}
+        if os.path.exists(frontier_path):
+            os.remove(frontier_path)
+        progress.save()
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if progress.data['stage'] == 'init':
+            done = set(progress.data['chunks_done'])
+            starts = [s for s in range(0, N_BLACK, chunk) if s not in done]
+            jobs = {pool.submit(_init_chunk, partial, s, min(s + chunk, N_BLACK)): s
+                    for s in starts}
+            for job in jobs:
+                with open(frontier_path, 'ab') as f:
+                    f.write(job.result())
+                progress.data['chunks_done'].append(jobs[job])
+                progress.save()
+            progress.data['stage'] = 'retro'
+            progress.save()
+
+        while progress.data['stage'] == 'retro':
+            level = progress.data['level']
+            frontier = array('I')
+            with open(frontier_path, 'rb') as f:
+                frontier.frombytes(f.read())
+            # an init chunk redone after a restart, a redone level or two
+            # workers resolving the same position can each list it again
+            frontier = array('I', sorted(set(frontier)))
+            if len(frontier) == 0:
+                progress.data['stage'] = 'done'
+                progress.save()
+                break
+            if level + 1 > MAX_DISTANCE:
+                raise OverflowError("distance to win exceeds " + str(MAX_DISTANCE) + " plies")
+            redo = progress.data.get('running') == level
+            progress.data['running'] = level
+            progress.save()
+            slices = _split(frontier, workers * 4)
+            found = pool.map(_level_chunk, [partial] * len(slices), [level] * len(slices),
+                             [s.tobytes() for s in slices], [redo] * len(slices))
+            with open(frontier_path + '.tmp', 'wb') as f:
+                for part in found:
+                    f.write(part)
+            os.replace(frontier_path + '.tmp', frontier_path)
+            progress.data['level'] = level + 1
+            progress.save()
+
+    os.replace(partial, path)
+    for leftover in (frontier_path, progress.path):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+
+############################################################################
+#
+# Lookup
+#
+############################################################################
+
+class Tablebase:
+    """ Read-only view of a built table. The file is memory-mapped on the first
+    lookup, so creating a Tablebase costs nothing; if the file does not exist
+    every lookup returns None.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.table = None
+        self.checked = False
+
+    def available(self):
+        if not self.checked:
+            self.checked = True
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as f:
+                    self.table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if self.table[:len(MAGIC)] != MAGIC or len(self.table) != HEADER_SIZE + SIZE:
+                    self.table.close()
+                    self.table = None
+                    raise ValueError(self.path + " is not a Teeko2 tablebase")
+        return self.table is not None
+
+    def value(self, bits, turn):
+        """ Raw table byte for a move phase position, or None """
+        if not self.available():
+            return None
+        try:
+            return self.table[HEADER_SIZE + index(bits, turn)]
+        except KeyError:
+            return None # not a move phase position
+
+    def probe(self, bits, turn):
+        """ Returns (result, distance) for the side to move, see decode() """
+        value = self.value(bitboard.to_bits(bits), turn)
+        return None if value is None else decode(value)
+
+    def best_move(self, state, turn):
+        """ Returns the (src, dst) move that wins fastest, else holds the draw,
+        else loses slowest; None if the table cannot answer for this position.
+        """
+        bits = bitboard.to_bits(state)
+        if self.value(bits, turn) is None:
+            return None
+        best = None
+        best_key = None
+        for move in bitboard.iter_moves(bits[turn], bits[1 - turn]):
+            child = bitboard.apply_move(bits, turn, *move)
+            (result, distance) = decode(self.value(child, 1 - turn))
+            if result == 'loss':
+                key = (2, -distance)
+            elif result == 'draw':
+                key = (1, 0)
+            else:
+                key = (0, distance)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+
+    def close(self):
+        if self.table is not None:
+            self.table.close()
+            self.table = None
+        self.checked = False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Teeko2 move phase tablebase")
+    parser.add_argument('--path', default=DEFAULT_PATH)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    build(args.path, args.workers)
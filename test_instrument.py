@@ -0,0 +1,31 @@
+import pytest
+
+import benchmark
+import instrument
+
+
+def counted_records(search, depth=2):
+    positions = benchmark.sample_positions(6, 0)
+    records = instrument.run_canned(positions, depth, search)
+    return [r for r in records if r['nodes'] > 0] # drop moves with nothing to search
+
+
+@pytest.mark.parametrize('search', ['minimax', 'alphabeta', 'batched'])
+def test_counts_every_search(search):
+    if search == 'batched':
+        pytest.importorskip('numpy')
+    records = counted_records(search)
+    assert records
+    for record in records:
+        assert record['succ_calls'] > 1
+        assert record['leaf_evals'] > 0
+        assert set(record['nodes_by_depth']) == {'0', '1', '2'}
+        assert sum(record['nodes_by_depth'].values()) == record['nodes']
+
+
+def test_batched_counts_match_minimax():
+    pytest.importorskip('numpy')
+    keys = ('nodes', 'nodes_by_depth', 'succ_calls', 'leaf_evals', 'terminal')
+    minimax = counted_records('minimax')
+    batched = counted_records('batched')
+    assert [[r[k] for k in keys] for r in batched] == [[r[k] for k in keys] for r in minimax]
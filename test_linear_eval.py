@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+import bitboard
+import linear_eval
+
+np = pytest.importorskip('numpy')
+
+WEIGHTS = (0.1371, 0.44213, 1.3719, 0.0713, 0.31177, 1.12345)
+
+
+def random_positions(count, seed=0):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        bits = (0, 0)
+        for ply in range(rng.randrange(2, 30)):
+            turn = ply % 2
+            bits = bitboard.apply_move(bits, turn, *rng.choice(
+                list(bitboard.iter_moves(bits[turn], bits[1 - turn]))))
+            if bitboard.winner(bits) is not None:
+                break
+        else:
+            positions.append(bits)
+    return positions
+
+
+@pytest.mark.parametrize('me', [0, 1])
+def test_scores_match_score_exactly(me):
+    linear = linear_eval.LinearEvaluator(weights=WEIGHTS)
+    positions = random_positions(3000)
+    assert linear.scores(positions, me).tolist() == [linear.score(p, me) for p in positions]
+
+
+def test_feature_matrix_matches_features():
+    positions = random_positions(500, seed=1)
+    assert linear_eval.feature_matrix(positions, 0).tolist() == \
+        [linear_eval.features(p, 0) for p in positions]
+
+
+def test_scores_of_no_positions():
+    assert len(linear_eval.LinearEvaluator(weights=WEIGHTS).scores([], 0)) == 0
@@ -0,0 +1,137 @@
+""" Threat detection: immediate wins, forced blocks and double threats.
+
+A color is one move from winning when three of its markers lie on a winning
+line or diamond ring whose fourth square (the gap) is empty, the diamond's
+center is empty too, and the color can put a marker on the gap: by dropping
+it during the drop phase, or afterwards by moving a marker off the line from a
+square next to the gap. Which lines hold three markers of a color depends only
+on that color's bitboard, so they are memoized per bitboard like the profiles
+in bitboard.py, and finding the winning moves of a position takes a dictionary
+lookup and a few mask tests.
+
+forced_move() uses this to answer the common tactical positions without a
+search, and the searches use winning_move() to score a node whose side to move
+can win on the spot without expanding it.
+"""
+import bitboard
+
+# per-color near lines: (gap, line, center) for every winning line or diamond
+# ring holding three of the color's markers, gap as a square index and center
+# as a mask (0 for straight lines)
+_near = {}
+
+
+def _near_lines(mine):
+    count = bitboard.popcount
+    lines = []
+    for m in bitboard.WIN_LINES:
+        if count(mine & m) == 3:
+            lines.append(((m & ~mine).bit_length() - 1, m, 0))
+    for (ring, center) in bitboard.DIAMONDS:
+        if count(mine & ring) == 3:
+            lines.append(((ring & ~mine).bit_length() - 1, ring, center))
+    profile = tuple(lines)
+    _near[mine] = profile
+    return profile
+
+
+def _candidates(mine, theirs):
+    """ Legal (src, dst) moves of the color whose markers are `mine` that fill
+    the gap of one of its near lines.
+    """
+    try:
+        profile = _near[mine]
+    except KeyError:
+        profile = _near_lines(mine)
+    if not profile:
+        return ()
+    occupied = mine | theirs
+    drop = bitboard.popcount(mine) < 4
+    moves = []
+    for (gap, line, center) in profile:
+        if occupied >> gap & 1 or theirs & center:
+            continue
+        if drop:
+            sources = [None]
+        else:
+            # a marker on the diamond's center has to be the one that moves
+            x = bitboard.ADJACENT[gap] & mine & ~line
+            if mine & center:
+                x &= center
+            sources = []
+            while x:
+                low = x & -x
+                sources.append(low.bit_length() - 1)
+                x ^= low
+        for src in sources:
+            if (src, gap) not in moves:
+                moves.append((src, gap))
+    return moves
+
+
+def winning_moves(bits, turn):
+    """ Returns the (src, dst) moves after which color turn has won, in an
+    undecided (black, red) position.
+    """
+    return [move for move in _candidates(bits[turn], bits[1 - turn])
+            if bitboard.winner(bitboard.apply_move(bits, turn, *move)) == turn]
+
+
+def winning_move(bits, turn):
+    """ The first of winning_moves(bits, turn), or None """
+    if _near.get(bits[turn]) == (): # the usual case, without a call
+        return None
+    for move in _candidates(bits[turn], bits[1 - turn]):
+        if bitboard.winner(bitboard.apply_move(bits, turn, *move)) == turn:
+            return move
+    return None
+
+
+def unstoppable(bits, turn):
+    """ True if color turn, with the other color to move, threatens to win on
+    its next move in a way no reply prevents: two or more threats no single
+    move blocks, or one the other color cannot reach. False if the other color
+    can win on the spot instead.
+    """
+    other = 1 - turn
+    if winning_move(bits, turn) is None or winning_move(bits, other) is not None:
+        return False
+    for (src, dst) in bitboard.iter_moves(bits[other], bits[turn]):
+        child = bitboard.apply_move(bits, other, src, dst)
+        # a reply can only hand turn the win, by vacating a diamond center
+        if bitboard.winner(child) != turn and winning_move(child, turn) is None:
+            return False
+    return True
+
+
+def forced_move(bits, turn):
+    """ Finds a move color turn should play in an undecided position without
+    searching.
+
+    Returns:
+        tuple: a (src, dst) move as yielded by bitboard.iter_moves: a move that
+            wins on the spot; otherwise, when the other color threatens to win,
+            the only move that stops it, or a move blocking one of its wins if
+            none stops them all; otherwise a move that leaves the other color an
+            unstoppable threat (see unstoppable()). None if there is no such move.
+    """
+    move = winning_move(bits, turn)
+    if move is not None:
+        return move
+    other = 1 - turn
+    moves = list(bitboard.iter_moves(bits[turn], bits[other]))
+    safe = []
+    for move in moves:
+        child = bitboard.apply_move(bits, turn, *move)
+        if bitboard.winner(child) is None and winning_move(child, other) is None:
+            safe.append((move, child))
+    if winning_move(bits, other) is not None and len(safe) <= 1:
+        if safe:
+            return safe[0][0]
+        # lost against any defense: block one win and hope it is missed
+        gaps = [dst for (src, dst) in winning_moves(bits, other)]
+        return next((move for move in moves if move[1] in gaps), None)
+    for (move, child) in safe:
+        if unstoppable(child, turn):
+            return move
+    return None
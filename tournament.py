@@ -0,0 +1,239 @@
+""" Headless self-play tournaments between Teeko2Player configurations.
+
+Every pair of configurations plays the requested number of games, alternating
+colors. Games are independent and seeded (the first opening_plies drops of
+game k are random with seed + k), so a tournament is reproducible whatever the
+number of worker processes. Each move made by a configuration is recorded with
+its latency, nodes searched, branching factor and completed depth; the report
+aggregates them per configuration together with the results.
+
+Usage:
+    python tournament.py --games 20 --player ab2:depth=2 --player ab3:depth=3 \\
+        --report report.json
+"""
+import argparse
+import csv
+import json
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import bitboard
+import game
+import game_records
+import linear_eval
+import mcts
+
+PlayerConfig = namedtuple('PlayerConfig', ['name', 'depth', 'search', 'time_limit_ms',
+                                           'book', 'tablebase', 'iterations', 'heuristic'])
+PlayerConfig.__new__.__defaults__ = (1, 'alphabeta', None, False, False, None, 'lines')
+PlayerConfig.__doc__ = """ Settings of one tournament entrant.
+
+    name (str): label used in the report
+    depth, search, time_limit_ms: passed to Teeko2Player.make_move
+    book (bool): consult the default opening book
+    tablebase (bool): consult the default move phase tablebase
+    iterations (int): playouts per move for search='mcts' (default 2000)
+    heuristic (str): 'lines' for the longest-line heuristic, 'linear' for a
+        linear_eval.LinearEvaluator with the default weights file, or the path
+        of another weights file
+"""
+
+MOVE_FIELDS = ['game', 'ply', 'player', 'color', 'phase', 'latency_ms', 'nodes',
+               'branching', 'depth']
+
+
+def _make_player(config, color):
+    player = game.Teeko2Player()
+    player.my_piece = player.pieces[color]
+    player.opp = player.pieces[1 - color]
+    if not config.book:
+        player.book = None
+    if not config.tablebase:
+        player.tablebase = None
+    if config.heuristic == 'linear':
+        player.linear = linear_eval.LinearEvaluator()
+    elif config.heuristic != 'lines':
+        player.linear = linear_eval.LinearEvaluator(config.heuristic)
+    if config.search == 'mcts':
+        player.mcts = mcts.MCTS(iterations=config.iterations or 2000,
+                                time_limit_ms=config.time_limit_ms)
+    return player
+
+
+def play_game(black, red, seed, opening_plies=2, max_plies=200):
+    """ Plays one game and returns its record, with every (src, dst) move in
+    'history'. A game still undecided after max_plies plies, or in which the
+    side to move has no legal move, is scored as a draw or a loss for that
+    side respectively.
+    """
+    rng = random.Random(seed)
+    configs = (black, red)
+    players = [_make_player(black, 0), _make_player(red, 1)]
+    bits = (0, 0)
+    moves = []
+    history = []
+    winner = None
+    ply = 0
+    while ply < max_plies:
+        turn = ply % 2
+        legal = list(bitboard.iter_moves(bits[turn], bits[1 - turn]))
+        if not legal:
+            winner = 1 - turn
+            break
+        if ply < opening_plies:
+            move = rng.choice(legal)
+        else:
+            player = players[turn]
+            player.stats = {}
+            start = time.perf_counter()
+            played = player.make_move(bitboard.to_state(bits), depth=configs[turn].depth,
+                                      search=configs[turn].search,
+                                      time_limit_ms=configs[turn].time_limit_ms)
+            latency = (time.perf_counter() - start) * 1000.0
+            move = bitboard.from_move_list(played)
+            src = move[0]
+            moves.append({'game': seed, 'ply': ply, 'player': configs[turn].name,
+                          'color': player.my_piece, 'phase': 'drop' if src is None else 'move',
+                          'latency_ms': latency, 'nodes': player.stats.get('nodes', 0),
+                          'branching': len(legal), 'depth': player.stats.get('depth')})
+        if move not in legal:
+            raise RuntimeError(configs[turn].name + " played an illegal move " + str(move))
+        bits = bitboard.apply_move(bits, turn, *move)
+        history.append(move)
+        ply += 1
+        winner = bitboard.winner(bits)
+        if winner is not None:
+            break
+    return {'seed': seed, 'black': black.name, 'red': red.name, 'plies': ply,
+            'winner': None if winner is None else configs[winner].name, 'moves': moves,
+            'history': history}
+
+
+def _play(job):
+    return play_game(*job)
+
+
+def run_tournament(configs, games, workers=1, seed=0, opening_plies=2, max_plies=200):
+    """ Plays `games` games between every pair of configs, alternating colors,
+    on `workers` processes. Returns the game records in a fixed order.
+    """
+    jobs = []
+    k = 0
+    for i in range(len(configs)):
+        for j in range(i + 1, len(configs)):
+            for g in range(games):
+                black, red = (configs[i], configs[j]) if g % 2 == 0 else (configs[j], configs[i])
+                jobs.append((black, red, seed + k, opening_plies, max_plies))
+                k += 1
+    if workers == 1:
+        return [_play(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_play, jobs))
+
+
+def percentile(values, p):
+    """ Nearest-rank percentile of a list of numbers, None if it is empty """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(results):
+    """ Aggregates game records per configuration name """
+    summary = {}
+    for result in results:
+        for name in (result['black'], result['red']):
+            s = summary.setdefault(name, {'games': 0, 'wins': 0, 'losses': 0, 'draws': 0})
+            s['games'] += 1
+            if result['winner'] is None:
+                s['draws'] += 1
+            elif result['winner'] == name:
+                s['wins'] += 1
+            else:
+                s['losses'] += 1
+    for name, s in summary.items():
+        moves = [m for result in results for m in result['moves'] if m['player'] == name]
+        latencies = [m['latency_ms'] for m in moves]
+        nodes = sum(m['nodes'] for m in moves)
+        seconds = sum(latencies) / 1000.0
+        depths = [m['depth'] for m in moves if m['depth'] is not None]
+        s['win_rate'] = s['wins'] / s['games'] if s['games'] else None
+        s['moves'] = len(moves)
+        for p in (50, 90, 99):
+            s['latency_p' + str(p) + '_ms'] = percentile(latencies, p)
+        s['latency_max_ms'] = max(latencies) if latencies else None
+        s['nodes_per_sec'] = nodes / seconds if seconds > 0 else None
+        s['mean_branching'] = sum(m['branching'] for m in moves) / len(moves) if moves else None
+        s['mean_depth'] = sum(depths) / len(depths) if depths else None
+    return summary
+
+
+def write_report(results, path):
+    """ Writes the per-move records as CSV if path ends in .csv, otherwise the
+    summary and the game records as JSON.
+    """
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=MOVE_FIELDS)
+            writer.writeheader()
+            for result in results:
+                writer.writerows(result['moves'])
+    else:
+        with open(path, 'w') as f:
+            json.dump({'summary': summarize(results), 'games': results}, f, indent=2)
+
+
+def write_records(results, path):
+    """ Appends the games to a game_records file """
+    with game_records.RecordWriter(path) as writer:
+        for result in results:
+            winner = result['winner']
+            color = None if winner is None else (0 if winner == result['black'] else 1)
+            writer.write(result['history'], color)
+
+
+def parse_player(spec):
+    """ Parses 'name:key=value,key=value' into a PlayerConfig """
+    name, _, options = spec.partition(':')
+    fields = {'name': name}
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        if key not in PlayerConfig._fields:
+            raise ValueError("Unknown player option: " + key)
+        if key in ('depth', 'iterations'):
+            value = int(value)
+        elif key == 'time_limit_ms':
+            value = float(value)
+        elif key in ('book', 'tablebase'):
+            value = value.lower() in ('1', 'true', 'yes')
+        fields[key] = value
+    return PlayerConfig(**fields)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a Teeko2Player self-play tournament")
+    parser.add_argument('--player', action='append', required=True,
+                        help="name:depth=2,search=alphabeta,time_limit_ms=50,book=1,tablebase=1,"
+                             "heuristic=linear or name:search=mcts,iterations=2000")
+    parser.add_argument('--games', type=int, default=10, help="games per pair of players")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--opening-plies', type=int, default=2)
+    parser.add_argument('--max-plies', type=int, default=200)
+    parser.add_argument('--report', default=None, help="write a .json or .csv report")
+    parser.add_argument('--records', default=None,
+                        help="append the games to this game_records file")
+    args = parser.parse_args()
+    configs = [parse_player(spec) for spec in args.player]
+    results = run_tournament(configs, args.games, args.workers, args.seed,
+                             args.opening_plies, args.max_plies)
+    for name, s in summarize(results).items():
+        print(name, s)
+    if args.report:
+        write_report(results, args.report)
+    if args.records:
+        write_records(results, args.records)
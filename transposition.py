@@ -0,0 +1,86 @@
+""" Zobrist-hashed transposition table for the Teeko2 search.
+
+Keys cover both colors' markers plus the side to move. The table is a fixed
+number of slots, so its memory stays bounded no matter how long a game runs;
+when two positions share a slot the deeper or more recent entry is kept.
+"""
+import random
+from collections import namedtuple
+
+# bound types: the stored score is exact, a lower bound or an upper bound
+EXACT, LOWER, UPPER = 0, 1, 2
+
+Entry = namedtuple('Entry', ['key', 'depth', 'score', 'bound', 'move', 'age'])
+
+# fixed seed so every process (and every run) hashes positions identically
+_rng = random.Random(0x7EE4C02)
+ZOBRIST = [[_rng.getrandbits(64) for i in range(25)] for color in range(2)]
+SIDE = [0, _rng.getrandbits(64)]
+# scores are stored from the searching player's point of view, so the color it
+# plays is part of the key as well
+PERSPECTIVE = [0, _rng.getrandbits(64)]
+
+
+def zobrist(bits, turn, me=0):
+    """ Returns the 64-bit hash of a (black, red) bitboard pair with
+    Teeko2Player.pieces[turn] to move, searched by Teeko2Player.pieces[me].
+    """
+    key = SIDE[turn] ^ PERSPECTIVE[me]
+    for color in range(2):
+        keys = ZOBRIST[color]
+        x = bits[color]
+        while x:
+            low = x & -x
+            key ^= keys[low.bit_length() - 1]
+            x ^= low
+    return key
+
+
+class TranspositionTable:
+    """ Fixed-size table of search results.
+
+    Args:
+        max_entries (int): number of slots; also the most entries ever held
+    """
+
+    def __init__(self, max_entries=1 << 16):
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self.slots = [None] * max_entries
+        self.age = 0
+        self.stats = {'probes': 0, 'hits': 0, 'stores': 0, 'evictions': 0}
+
+    def new_search(self):
+        """ Marks entries from earlier searches as stale, making them the first
+        to be replaced. They can still be probed until then.
+        """
+        self.age += 1
+
+    def probe(self, key):
+        """ Returns the Entry stored for key, or None """
+        self.stats['probes'] += 1
+        entry = self.slots[key % self.max_entries]
+        if entry is not None and entry.key == key:
+            self.stats['hits'] += 1
+            return entry
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        """ Records a search result. An entry from the current search is only
+        replaced by a different position searched at least as deep.
+        """
+        index = key % self.max_entries
+        old = self.slots[index]
+        if old is not None and old.key != key:
+            if old.age == self.age and old.depth > depth:
+                return
+            self.stats['evictions'] += 1
+        self.stats['stores'] += 1
+        self.slots[index] = Entry(key, depth, score, bound, move, self.age)
+
+    def clear(self):
+        self.slots = [None] * self.max_entries
+
+    def __len__(self):
+        return sum(1 for entry in self.slots if entry is not None)
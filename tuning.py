@@ -0,0 +1,183 @@
+""" Fits the weights of linear_eval.LinearEvaluator from self-play games.
+
+The pipeline has three steps:
+
+1. self_play() plays games between alpha-beta players, starting from random
+   drops and with a few random moves mixed in so the games differ, and
+   records every undecided position together with the game's result.
+2. dataset() turns the records into a feature matrix with
+   linear_eval.feature_matrix() (one NumPy pass over all positions) and win
+   targets for black: 1 for a black win, 0 for a red win, 0.5 for a draw.
+3. fit() runs a local logistic regression (Newton's method with L2
+   regularization) and linear_eval.save() writes the weights.
+
+The features are differences between the colors, so a position scored for
+red is the negation of the same position scored for black and the model needs
+no intercept. Needs numpy.
+
+Usage:
+    python tuning.py [--games 400] [--depth 1] [--workers 1] [--path teeko2_weights.json]
+        [--compare 20]
+
+--compare plays a tournament of the fitted evaluator against the longest-line
+heuristic at the same depth and one ply deeper.
+"""
+import argparse
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import bitboard
+import game
+import linear_eval
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _require():
+    if np is None:
+        raise ImportError("weight tuning needs numpy (pip install numpy)")
+
+
+def play_recorded(seed, depth=1, opening_plies=4, epsilon=0.1, max_plies=120, weights=None):
+    """ Plays one self-play game and returns (positions, winner): every
+    undecided position reached after the random opening and the index of the
+    winning color, None for a draw.
+
+    Args:
+        epsilon (float): chance of playing a random legal move instead of the
+            searched one after the opening
+        weights: linear_eval weights for both players, or None for the
+            longest-line heuristic
+    """
+    rng = random.Random(seed)
+    players = []
+    for color in (0, 1):
+        player = game.Teeko2Player()
+        player.my_piece = player.pieces[color]
+        player.opp = player.pieces[1 - color]
+        player.book = None
+        player.tablebase = None
+        if weights is not None:
+            player.linear = linear_eval.LinearEvaluator(weights=weights)
+        players.append(player)
+    bits = (0, 0)
+    positions = []
+    for ply in range(max_plies):
+        turn = ply % 2
+        legal = list(bitboard.iter_moves(bits[turn], bits[1 - turn]))
+        if not legal:
+            return (positions, 1 - turn)
+        if ply < opening_plies or rng.random() < epsilon:
+            move = rng.choice(legal)
+        else:
+            played = players[turn].make_move(bits, depth, 'alphabeta')
+            move = bitboard.from_move_list(played)
+        bits = bitboard.apply_move(bits, turn, *move)
+        w = bitboard.winner(bits)
+        if w is not None:
+            return (positions, w)
+        if ply + 1 >= opening_plies:
+            positions.append(bits)
+    return (positions, None)
+
+
+def _play(job):
+    return play_recorded(*job)
+
+
+def self_play(games, depth=1, seed=0, workers=1, opening_plies=4, epsilon=0.1, max_plies=120,
+              weights=None):
+    """ Plays `games` recorded games (see play_recorded) on `workers`
+    processes. Returns the records in seed order.
+    """
+    jobs = [(seed + k, depth, opening_plies, epsilon, max_plies, weights) for k in range(games)]
+    if workers == 1:
+        return [_play(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_play, jobs))
+
+
+def dataset(records):
+    """ Returns (x, y): the features of every recorded position for black and
+    the result of its game for black.
+    """
+    _require()
+    positions = []
+    targets = []
+    for (game_positions, winner) in records:
+        positions.extend(game_positions)
+        targets.extend([0.5 if winner is None else 1.0 - winner] * len(game_positions))
+    return (linear_eval.feature_matrix(positions, 0), np.array(targets))
+
+
+def fit(x, y, l2=1e-2, iterations=25, tolerance=1e-9):
+    """ Logistic regression without an intercept: the weights w minimizing the
+    mean log loss of sigmoid(x . w) against the targets y (in [0, 1]) plus
+    l2 / 2 * |w|^2, found by Newton's method.
+
+    Returns:
+        numpy array of weights, one per column of x
+    """
+    _require()
+    (n, k) = x.shape
+    w = np.zeros(k)
+    for i in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-(x @ w)))
+        gradient = x.T @ (p - y) / n + l2 * w
+        hessian = (x * (p * (1 - p))[:, None]).T @ x / n + l2 * np.eye(k)
+        step = np.linalg.solve(hessian, gradient)
+        w -= step
+        if step @ step < tolerance:
+            break
+    return w
+
+
+def log_loss(x, y, w):
+    """ Mean log loss of the weights w on (x, y) """
+    _require()
+    p = np.clip(1.0 / (1.0 + np.exp(-(x @ w))), 1e-12, 1 - 1e-12)
+    return float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p)))
+
+
+def tune(games=400, depth=1, seed=0, workers=1, path=linear_eval.DEFAULT_PATH, l2=1e-2):
+    """ Runs the whole pipeline and saves the weights to path.
+
+    Returns:
+        tuple: (weights, positions used, log loss)
+    """
+    records = self_play(games, depth, seed, workers)
+    (x, y) = dataset(records)
+    w = fit(x, y, l2)
+    linear_eval.save(w, path)
+    return (tuple(w), len(y), log_loss(x, y, w))
+
+
+if __name__ == "__main__":
+    import tournament
+    parser = argparse.ArgumentParser(description="Fit linear evaluation weights by self-play")
+    parser.add_argument('--games', type=int, default=400)
+    parser.add_argument('--depth', type=int, default=1, help="search depth of the self-play games")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--l2', type=float, default=1e-2)
+    parser.add_argument('--path', default=linear_eval.DEFAULT_PATH)
+    parser.add_argument('--compare', type=int, default=0,
+                        help="games per pairing of a tournament against the line heuristic")
+    args = parser.parse_args()
+    (weights, n, loss) = tune(args.games, args.depth, args.seed, args.workers, args.path, args.l2)
+    print(n, 'positions, log loss', round(loss, 4))
+    for (name, w) in zip(linear_eval.FEATURES, weights):
+        print(name.ljust(10), round(w, 4))
+    if args.compare:
+        d = args.depth
+        configs = [tournament.PlayerConfig('linear' + str(d), depth=d, heuristic=args.path),
+                   tournament.PlayerConfig('lines' + str(d), depth=d),
+                   tournament.PlayerConfig('lines' + str(d + 1), depth=d + 1)]
+        summary = tournament.summarize(tournament.run_tournament(configs, args.compare,
+                                                                 args.workers, args.seed))
+        for name, s in summary.items():
+            print(name.ljust(8), 'win rate', round(s['win_rate'], 3), ' draws', s['draws'],
+                  ' p50', round(s['latency_p50_ms'], 2), 'ms')